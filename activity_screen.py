@@ -0,0 +1,93 @@
+import os
+
+import cv2
+
+from motion_gate import MotionGate
+from yolo_detector import YOLODetection
+
+# Cascade: clips are screened locally and only sent to Gemini if people are moving in them
+ANALYSIS_CASCADE = os.getenv('ANALYSIS_CASCADE', '1') != '0'
+CASCADE_SAMPLE_SECONDS = float(os.getenv('CASCADE_SAMPLE_SECONDS', '0.5'))
+CASCADE_MOTION_THRESHOLD = float(os.getenv('CASCADE_MOTION_THRESHOLD', '0.005'))
+# Part of analysis cache keys: screened and unscreened results are not interchangeable
+CASCADE_VERSION = (f"cascade-{CASCADE_SAMPLE_SECONDS:g}s-{CASCADE_MOTION_THRESHOLD:g}"
+                   if ANALYSIS_CASCADE else "no-cascade")
+
+
+class ActivityScreener:
+    """
+    Cheap local stage in front of Gemini.
+    Samples one frame every sample_seconds, compares it with the previous
+    sample (motion gate) and runs the person detector only on samples that
+    moved. A video is active if at least one moving sample has people in it.
+    """
+    def __init__(self, sample_seconds=CASCADE_SAMPLE_SECONDS, motion_threshold=CASCADE_MOTION_THRESHOLD,
+                 detector=None):
+        self.sample_seconds = sample_seconds
+        self.motion_threshold = motion_threshold
+        self.detector = detector or YOLODetection()
+
+    def samples(self, video_path):
+        """
+        Yields (seconds, moving, people) for each sampled frame. people is the
+        number of people detected, or None when the sample did not move and
+        the detector was not run. The first sample has nothing to compare with
+        and counts as still.
+        """
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise IOError(f"Could not open video file {video_path}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        step = max(1, round(fps * self.sample_seconds))
+        gate = MotionGate(threshold=self.motion_threshold)
+        frame_index = 0
+        try:
+            # Every frame is still decoded by grab(); samples are a few frames apart, closer than
+            # keyframes usually are, so seeking would not save decoding. Only samples are converted.
+            while cap.grab():
+                if frame_index % step == 0:
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        break
+                    fraction, gray = gate.changed_fraction(frame)
+                    moving = gate.reference is not None and fraction >= self.motion_threshold
+                    gate.reference = gray
+                    people = len(self.detector.detect_humans(frame)) if moving else None
+                    yield frame_index / fps, moving, people
+                frame_index += 1
+        finally:
+            cap.release()
+
+    def screen(self, video_path):
+        """
+        Screens a video, stopping at the first moving sample with people.
+        Returns {'active', 'people', 'samples', 'moving_samples'}.
+        """
+        result = {'active': False, 'people': 0, 'samples': 0, 'moving_samples': 0}
+        for _, moving, people in self.samples(video_path):
+            result['samples'] += 1
+            if not moving:
+                continue
+            result['moving_samples'] += 1
+            if people:
+                result['active'] = True
+                result['people'] = people
+                break
+        return result
+
+
+def screening_summary(screen):
+    """Analysis text for a video that was screened out locally and not sent to Gemini."""
+    reason = "no people detected" if screen['moving_samples'] else "no motion detected"
+    return f"Scene appears normal. (Locally screened: {reason}; not sent to Gemini)"
+
+
+_screener = None
+
+
+def get_screener():
+    """The process-wide ActivityScreener (its detector shares the network through model_registry)."""
+    global _screener
+    if _screener is None:
+        _screener = ActivityScreener()
+    return _screener
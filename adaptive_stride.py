@@ -0,0 +1,27 @@
+class AdaptiveStride:
+    """
+    Decides which frames go through the detector.
+    The stride doubles after every empty detection (up to max_stride) and
+    drops back to min_stride as soon as a person is seen. Boxes for the frames
+    in between come from the tracker's prediction (SortTracker.step()).
+    """
+    def __init__(self, min_stride=1, max_stride=8):
+        self.min_stride = max(1, min_stride)
+        self.max_stride = max(self.min_stride, max_stride)
+        self.stride = self.min_stride
+        self.frames_since_detection = None
+
+    def should_detect(self):
+        """Call once per frame. True when the detector should run on this frame."""
+        if self.frames_since_detection is None or self.frames_since_detection + 1 >= self.stride:
+            self.frames_since_detection = 0
+            return True
+        self.frames_since_detection += 1
+        return False
+
+    def update(self, num_detections):
+        """Adjusts the stride from the result of the last detector run."""
+        if num_detections > 0:
+            self.stride = self.min_stride
+        else:
+            self.stride = min(self.max_stride, self.stride * 2)
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+ANALYSIS_CACHE_PATH = os.getenv('ANALYSIS_CACHE_PATH', 'analysis_cache.sqlite3')
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', '1000'))
+ANALYSIS_CACHE_TTL_SECONDS = float(os.getenv('ANALYSIS_CACHE_TTL_SECONDS', str(30 * 24 * 3600)))
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_key(content_hash, kind, version):
+    """Cache key for one kind of analysis ('clips', 'full', ...) of some content with a given prompt/model version."""
+    return f"{kind}:{version}:{content_hash}"
+
+
+class _Flight:
+    """One in-flight computation that other requests for the same key wait on."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class AnalysisCache:
+    """
+    Persistent analysis results keyed by video content, not by filename.
+    Entries expire after ttl_seconds and the least recently used ones are
+    evicted beyond max_entries. get_or_compute() runs a single analysis per
+    key no matter how many requests ask for it at the same time.
+    Labels (e.g. uploaded filenames) map to keys in their own table, so every
+    filename uploaded with the same content finds the shared result.
+    """
+    def __init__(self, path=ANALYSIS_CACHE_PATH, max_entries=ANALYSIS_CACHE_MAX_ENTRIES,
+                 ttl_seconds=ANALYSIS_CACHE_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS analyses ('
+                ' key TEXT PRIMARY KEY, result TEXT NOT NULL,'
+                ' created_at REAL NOT NULL, last_used REAL NOT NULL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS analyses_last_used ON analyses (last_used)')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS labels ('
+                ' label TEXT NOT NULL, key TEXT NOT NULL, updated_at REAL NOT NULL,'
+                ' PRIMARY KEY (label, key))')
+
+    def get(self, key):
+        """Returns the cached result for key, or None."""
+        now = time.time()
+        with self._lock, self._db:
+            self._expire(now)
+            row = self._db.execute('SELECT result FROM analyses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute('UPDATE analyses SET last_used = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def get_by_label(self, label, kind):
+        """Most recent result of one kind of analysis ('full', 'clips', ...) stored under a label, or None."""
+        prefix = f"{kind}:"
+        with self._lock:
+            row = self._db.execute(
+                'SELECT analyses.result FROM labels JOIN analyses ON analyses.key = labels.key '
+                'WHERE labels.label = ? AND substr(labels.key, 1, ?) = ? '
+                'ORDER BY labels.updated_at DESC LIMIT 1', (label, len(prefix), prefix)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add_label(self, key, label):
+        """Makes the result for key findable under label as well."""
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO labels (label, key, updated_at) VALUES (?, ?, ?)',
+                             (label, key, time.time()))
+
+    def put(self, key, result, label=None):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO analyses (key, result, created_at, last_used) '
+                             'VALUES (?, ?, ?, ?)', (key, json.dumps(result), now, now))
+            if label is not None:
+                self._db.execute('INSERT OR REPLACE INTO labels (label, key, updated_at) VALUES (?, ?, ?)',
+                                 (label, key, now))
+            self._expire(now)
+            self._db.execute(
+                'DELETE FROM analyses WHERE key NOT IN '
+                '(SELECT key FROM analyses ORDER BY last_used DESC LIMIT ?)', (self.max_entries,))
+            self._db.execute('DELETE FROM labels WHERE key NOT IN (SELECT key FROM analyses)')
+
+    def _expire(self, now):
+        if self.ttl_seconds:
+            expired = self._db.execute('DELETE FROM analyses WHERE created_at < ?', (now - self.ttl_seconds,))
+            if expired.rowcount:
+                self._db.execute('DELETE FROM labels WHERE key NOT IN (SELECT key FROM analyses)')
+
+    def get_or_compute(self, key, compute, label=None):
+        """
+        Returns the cached result for key, or runs compute() once for all concurrent callers.
+        compute() returns (result, cacheable); results that are not cacheable (errors,
+        demo data) are still shared with the waiting callers but not stored.
+        """
+        result = self.get(key)
+        if result is not None:
+            self.hits += 1
+            if label is not None:
+                self.add_label(key, label)
+            print(f"Returning cached analysis for {label or key}")
+            return result
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            print(f"Waiting for the analysis already running for {label or key}")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            # A flight for this key may have finished between the lookup above and now
+            flight.value = self.get(key)
+            if flight.value is not None:
+                return flight.value
+            self.misses += 1
+            flight.value, cacheable = compute()
+            if cacheable:
+                self.put(key, flight.value, label)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute('SELECT COUNT(*) FROM analyses').fetchone()[0]
+        return {'entries': entries, 'hits': self.hits, 'misses': self.misses, 'in_flight': len(self._flights)}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process-wide AnalysisCache, opened on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnalysisCache()
+        return _cache
@@ -6,26 +6,136 @@ import base64
 import json
 import threading
 import subprocess
-from flask import Flask, request, jsonify, render_template, url_for, send_from_directory
+import time
+import uuid
+from flask import Flask, Response, request, jsonify, render_template, url_for, send_from_directory, stream_with_context
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import secure_filename
 from config import UPLOAD_FOLDER, ALLOWED_EXTENSIONS
-from video_processor import process_video, analyze_full_video
+from video_processor import process_video, iter_process_video, analyze_full_video, AnalysisIncomplete, \
+    InvalidVideo
 from yolo_detector import YOLODetection
+from model_registry import warm_up
+from adaptive_stride import AdaptiveStride
+from tracker import SortTracker
+from motion_gate import MotionGate
+from analysis_cache import get_cache
+from ingest import IngestRequest, ResumableUploads
+from jobs import JobManager
+from frame_codec import decode_jpeg
+import gemini_service
+from batch_dispatcher import InferenceDispatcher
+from inference_pool import InferencePool, INFERENCE_WORKERS
+
+try:
+    from flask_sock import Sock
+except ImportError:  # optional, enables the /ws/frames WebSocket
+    Sock = None
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500 MB max file size
 
-# Initialize YOLO Detector
-print("Initializing YOLO Detector...")
+# Uploads are hashed, probed and size-checked while the request body streams in
+IngestRequest.upload_folder = UPLOAD_FOLDER
+app.request_class = IngestRequest
+resumable_uploads = ResumableUploads(UPLOAD_FOLDER, max_bytes=app.config['MAX_CONTENT_LENGTH'])
+
+# Long analyses run as background jobs (see /jobs), job state is kept in SQLite
+jobs = JobManager()
+
+# Initialize YOLO Detector. The shared network loads in the background so
+# startup does not wait on the weights; the first request waits if it is not ready yet.
 yolo = YOLODetection()
-print("YOLO Detector initialized.")
+
+# With INFERENCE_WORKERS > 1, inference runs in that many worker processes,
+# each with its own network and its own share of the CPU cores
+inference_pool = InferencePool(model_name=yolo.model.name, input_size=yolo.input_size) \
+    if INFERENCE_WORKERS > 1 else None
+
+# Concurrent /process_frame requests are micro-batched: frames that arrive within
+# FRAME_BATCH_WAIT_MS of each other (up to FRAME_BATCH_SIZE) share one forward pass.
+# With a worker pool, one batch per worker can be in flight.
+frame_dispatcher = InferenceDispatcher(
+    inference_pool.detect_batch if inference_pool else yolo.detect_humans_batch_with_confidences,
+    max_batch=int(os.getenv('FRAME_BATCH_SIZE', '8')),
+    max_wait_ms=float(os.getenv('FRAME_BATCH_WAIT_MS', '8')),
+    threads=inference_pool.workers if inference_pool else 1)
+
+_services_started = False
+_services_lock = threading.Lock()
+
+
+def start_background_services():
+    """
+    Model warm-up, the inference workers and unfinished jobs. Runs once, in the
+    process that serves requests: not in the reloader's watcher process and not
+    in inference workers, which import this module again.
+    """
+    global _services_started
+    with _services_lock:
+        if _services_started:
+            return
+        _services_started = True
+
+    if inference_pool:
+        inference_pool.start()
+    else:
+        warm_up([yolo.model.name])
+    resumed = jobs.resume()
+    if resumed:
+        print(f"Resumed {resumed} unfinished analysis jobs")
+
+
+@app.before_request
+def ensure_background_services():
+    # Covers WSGI servers, which import the app without running __main__
+    start_background_services()
 
 # Create upload folder if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Store analysis results in memory (in production, use Redis or database)
-analysis_cache = {}
+# Per-stream detection state for /process_frame. The browser sends a frame every
+# ~100 ms; YOLO only runs on keyframes where the scene changed and the tracker
+# covers the requests in between.
+frame_streams = {}
+frame_streams_lock = threading.Lock()
+FRAME_STREAM_IDLE_SECONDS = 60
+MOTION_THRESHOLD = float(os.getenv('MOTION_THRESHOLD', '0.005'))  # fraction of the frame that must change
+
+
+def get_frame_stream(stream_id):
+    """Returns the stride/tracker state for a stream, dropping streams that went idle."""
+    now = time.time()
+    with frame_streams_lock:
+        for key in [k for k, v in frame_streams.items() if now - v['last_seen'] > FRAME_STREAM_IDLE_SECONDS]:
+            del frame_streams[key]
+
+        if stream_id not in frame_streams:
+            frame_streams[stream_id] = {
+                'stride': AdaptiveStride(min_stride=1, max_stride=4),
+                'tracker': SortTracker(),
+                'motion_gate': MotionGate(threshold=MOTION_THRESHOLD),
+                'scale': 1,  # frames are decoded at 1/scale of the size the browser sent
+                'lock': threading.Lock(),
+            }
+        stream = frame_streams[stream_id]
+        stream['last_seen'] = now
+        return stream
+
+
+def tracks_to_json(tracks, scale=1):
+    """Converts tracks to the detection format the frontend expects."""
+    detections = []
+    for track in tracks:
+        x, y, w, h = (int(v * scale) for v in track.box)
+        detections.append({'id': track.id, 'x': x, 'y': y, 'w': w, 'h': h})
+    return detections
+
+
+def compact_detections(tracks, scale=1):
+    """Compact response: {"d": [[id, x, y, w, h], ...]} in the coordinates of the frame that was sent."""
+    return {'d': [[track.id] + [int(v * scale) for v in track.box] for track in tracks]}
 
 def allowed_file(filename):
     """Checks if the uploaded file has an allowed extension."""
@@ -89,7 +199,7 @@ def send_sms_alert(alert_type, timestamp, description=""):
 @app.route('/')
 def index():
     """Renders the main HTML page."""
-    return render_template('index.html')
+    return render_template('index.html', websocket_enabled=Sock is not None)
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -103,15 +213,63 @@ def upload_file():
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
         video_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(video_path)
-        
-        results = process_video(video_path)
-        video_url = url_for('uploaded_file', filename=filename)
-
-        return jsonify({'results': results, 'video_path': video_url})
+        # The body was hashed and probed while it arrived, this just moves it into place
+        ingested = file.stream.finish(video_path)
+        return clip_analysis_response(ingested, filename)
     else:
         return jsonify({'error': 'Invalid file type'}), 400
 
+
+def clip_analysis_response(ingested, filename):
+    """Splits an ingested upload into clips, analyzes them and returns the results."""
+    results = process_video(ingested.path, content_hash=ingested.sha256)
+    video_url = url_for('uploaded_file', filename=filename)
+    return jsonify({'results': results, 'video_path': video_url})
+
+
+@app.route('/upload_stream', methods=['POST'])
+def upload_stream():
+    """
+    Like /upload, but streams each clip's result as soon as it is analyzed.
+    NDJSON by default (one JSON object per line); Server-Sent Events with
+    ?format=sse or Accept: text/event-stream. The last message is {"done": true}.
+    """
+    if 'video' not in request.files:
+        return jsonify({'error': 'No video part in the request'}), 400
+    file = request.files['video']
+    if file.filename == '':
+        return jsonify({'error': 'No video selected for uploading'}), 400
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+
+    filename = secure_filename(file.filename)
+    ingested = file.stream.finish(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+    video_url = url_for('uploaded_file', filename=filename)
+    sse = request.args.get('format') == 'sse' or 'text/event-stream' in request.headers.get('Accept', '')
+
+    def encode(message, event=None):
+        if not sse:
+            return json.dumps(message) + '\n'
+        return (f"event: {event}\n" if event else '') + f"data: {json.dumps(message)}\n\n"
+
+    def generate():
+        yield encode({'video_path': video_url}, 'start')
+        clips = 0
+        for result in iter_process_video(ingested.path, content_hash=ingested.sha256):
+            clips += 1
+            yield encode(result, 'clip')
+        yield encode({'done': True, 'clips': clips}, 'done')
+
+    mimetype = 'text/event-stream' if sse else 'application/x-ndjson'
+    # Tell proxies (e.g. nginx) not to buffer the stream
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def unique_upload_name(original_name):
+    """uuid-prefixed secure filename so uploads with the same name do not overwrite each other."""
+    return f"{uuid.uuid4().hex[:8]}_{secure_filename(original_name)}"
+
 @app.route('/analyze_full', methods=['POST'])
 def analyze_full():
     """Analyzes the full video without splitting and returns timestamps of incidents."""
@@ -131,111 +289,357 @@ def analyze_full():
         
         if file and allowed_file(file.filename):
             # Generate unique filename to avoid conflicts
-            import uuid
-            unique_id = str(uuid.uuid4())[:8]
-            original_filename = secure_filename(file.filename)
-            filename = f"{unique_id}_{original_filename}"
+            filename = unique_upload_name(file.filename)
             video_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             
+            # The body was hashed and probed while it arrived, this just moves it into place
             print(f"Saving file to: {video_path}")
-            file.save(video_path)
-            
-            # Check if file was saved successfully
-            if not os.path.exists(video_path):
-                print(f"Error: File not saved at {video_path}")
-                return jsonify({'error': 'Failed to save video file'}), 500
-            
-            print(f"File saved successfully. Size: {os.path.getsize(video_path)} bytes")
-            
-            # Check if we have cached results
-            if filename in analysis_cache:
-                print(f"Returning cached results for {filename}")
-                return jsonify({'alerts': analysis_cache[filename]})
-            
-            # Analyze the full video
-            try:
-                print(f"Starting analysis of {video_path}")
-                alerts = analyze_full_video(video_path)
-                print(f"Analysis complete. Found {len(alerts)} alerts")
-                
-                # Send SMS notifications for violence alerts
-                if alerts and len(alerts) > 0:
-                    # Run SMS notifications in a separate thread to not block response
-                    def send_notifications():
-                        for alert in alerts:
-                            if alert['type'] == 'VIOLENCE_DETECTED':
-                                send_sms_alert(
-                                    alert_type="Violence",
-                                    timestamp=alert['start_time'],
-                                    description=alert.get('description', '')
-                                )
-                            elif alert['type'] == 'SUSPICIOUS_BEHAVIOR':
-                                # Optional: also send for suspicious behavior
-                                # send_sms_alert("Suspicious Activity", alert['start_time'])
-                                pass
-                    
-                    # Start SMS thread
-                    sms_thread = threading.Thread(target=send_notifications)
-                    sms_thread.daemon = True
-                    sms_thread.start()
-                
-                # Cache the results
-                analysis_cache[filename] = alerts
-                
-                return jsonify({'alerts': alerts})
-                
-            except Exception as e:
-                print(f"Error during video analysis: {str(e)}")
-                import traceback
-                traceback.print_exc()
-                
-                # Try to clean up the file if analysis failed
-                try:
-                    if os.path.exists(video_path):
-                        os.remove(video_path)
-                except:
-                    pass
-                
-                return jsonify({'error': f'Failed to analyze video: {str(e)}'}), 500
+            ingested = file.stream.finish(video_path)
+            print(f"File saved successfully. Size: {ingested.size} bytes")
+            return full_analysis_response(ingested)
         else:
             print(f"Error: Invalid file type for {file.filename}")
             return jsonify({'error': 'Invalid file type. Allowed types: ' + ', '.join(ALLOWED_EXTENSIONS)}), 400
             
+    except HTTPException:
+        # e.g. 413 from the ingest size check
+        raise
     except Exception as e:
         print(f"Unexpected error in /analyze_full: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
-@app.route('/process_frame', methods=['POST'])
-def handle_frame_processing():
-    """Receives a frame from the frontend and returns YOLO detections."""
-    data = request.get_json()
-    if not data or 'image_data' not in data:
-        return jsonify({'error': 'No image data provided'}), 400
-    
+
+def full_analysis_response(ingested):
+    """Analyzes an ingested upload as a whole, sends SMS alerts and returns the alerts."""
+    video_path = ingested.path
+
+    # Analyze the full video (served from the analysis cache if this content was seen before)
     try:
-        # Decode the image data sent from the browser
-        img_data = data['image_data'].split(',')[1]
-        decoded_data = base64.b64decode(img_data)
-        np_arr = np.frombuffer(decoded_data, np.uint8)
-        frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+        print(f"Starting analysis of {video_path}")
+        alerts = analyze_and_notify(video_path, ingested.sha256, ingested.metadata)
+        print(f"Analysis complete. Found {len(alerts)} alerts")
+        
+        return jsonify({'alerts': alerts, 'analyzed': True})
+        
+    except AnalysisIncomplete as e:
+        # Not a clean video: Gemini did not answer, the client should retry later
+        print(f"Video analysis incomplete: {str(e)}")
+        return jsonify({'error': str(e), 'analyzed': False, 'alerts': e.alerts}), 503
 
-        if frame is None:
-            return jsonify({'error': 'Could not decode image'}), 400
+    except InvalidVideo as e:
+        # The upload itself is unusable, retrying will not help
+        print(f"Invalid video: {str(e)}")
+        try:
+            os.remove(video_path)
+        except OSError:
+            pass
+        return jsonify({'error': str(e), 'analyzed': False}), 422
 
-        # Use the detect_humans method from your class instance
-        boxes = yolo.detect_humans(frame)
+    except Exception as e:
+        print(f"Error during video analysis: {str(e)}")
+        import traceback
+        traceback.print_exc()
         
-        # Convert the results to the format the frontend expects
-        detections = [{'x': box[0], 'y': box[1], 'w': box[2], 'h': box[3]} for box in boxes]
+        # Try to clean up the file if analysis failed
+        try:
+            if os.path.exists(video_path):
+                os.remove(video_path)
+        except:
+            pass
         
-        return jsonify({'detections': detections})
+        return jsonify({'error': f'Failed to analyze video: {str(e)}'}), 500
+
+def analyze_and_notify(video_path, content_hash, video_info, progress=None):
+    """
+    analyze_full_video that sends each alert's SMS as soon as the alert is streamed
+    in, then the SMS for alerts that did not arrive that way (e.g. cached results).
+    In a job, the alerts notified so far are saved with the job, so a job resumed
+    after a restart does not send them again.
+    """
+    saved = progress.state.get('notified', []) if progress else []
+    notified = {tuple(key) for key in saved}
+
+    def notify_new(new_alerts):
+        new_alerts = [alert for alert in new_alerts if alert_key(alert) not in notified]
+        if not new_alerts:
+            return
+        notified.update(alert_key(alert) for alert in new_alerts)
+        if progress:
+            progress.save_state(notified=sorted(notified))
+        notify_alerts(new_alerts)
+
+    def on_alert(alert):
+        notify_new([alert])
+        if progress:
+            progress('analyzing', alerts_found=len(notified))
+
+    alerts = analyze_full_video(video_path, content_hash=content_hash, video_info=video_info,
+                                progress=progress, on_alert=on_alert)
+    notify_new(alerts)
+    return alerts
+
+def alert_key(alert):
+    return (alert['start_time'], alert['end_time'], alert['type'])
+
+def notify_alerts(alerts):
+    """Sends SMS notifications for violence alerts from a full-video analysis."""
+    # Send SMS notifications for violence alerts
+    if alerts and len(alerts) > 0:
+        # Run SMS notifications in a separate thread to not block response
+        def send_notifications():
+            for alert in alerts:
+                if alert['type'] == 'VIOLENCE_DETECTED':
+                    send_sms_alert(
+                        alert_type="Violence",
+                        timestamp=alert['start_time'],
+                        description=alert.get('description', '')
+                    )
+                elif alert['type'] == 'SUSPICIOUS_BEHAVIOR':
+                    # Optional: also send for suspicious behavior
+                    # send_sms_alert("Suspicious Activity", alert['start_time'])
+                    pass
+            
+        # Start SMS thread
+        sms_thread = threading.Thread(target=send_notifications)
+        sms_thread.daemon = True
+        sms_thread.start()
+
+
+# Background analysis jobs: POST /jobs returns a job id immediately, the analysis
+# runs on the job workers and GET /jobs/<id> reports its stage.
+def run_full_job(params, progress):
+    alerts = analyze_and_notify(params['video_path'], params['sha256'], params['metadata'], progress)
+    return {'alerts': alerts}
+
+def run_clips_job(params, progress):
+    results = process_video(params['video_path'], content_hash=params['sha256'], progress=progress)
+    return {'results': results, 'video_path': params['video_url']}
+
+jobs.register('full', run_full_job)
+jobs.register('clips', run_clips_job)
+
+
+def submit_job(ingested, filename, mode):
+    """Queues an analysis job for an ingested upload and returns the 202 response."""
+    job_id = jobs.submit('clips' if mode == 'clips' else 'full', {
+        'video_path': ingested.path,
+        'video_url': url_for('uploaded_file', filename=filename),
+        'sha256': ingested.sha256,
+        'metadata': ingested.metadata,
+    })
+    return jsonify({
+        'job_id': job_id,
+        'status_url': url_for('job_status', job_id=job_id),
+        'result_url': url_for('job_result', job_id=job_id),
+    }), 202
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Accepts a video like /analyze_full (or /upload with mode=clips) but analyzes it in the background."""
+    if 'video' not in request.files:
+        return jsonify({'error': 'No video part in the request'}), 400
+    file = request.files['video']
+    if file.filename == '':
+        return jsonify({'error': 'No video selected'}), 400
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file type. Allowed types: ' + ', '.join(ALLOWED_EXTENSIONS)}), 400
+
+    filename = unique_upload_name(file.filename)
+    ingested = file.stream.finish(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+    return submit_job(ingested, filename, request.form.get('mode', 'full'))
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Job status and current stage (queued, uploading, processing, analyzing, parsing, done, failed)."""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    del job['result']
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """The job's result once it is done; 202 with the current stage while it is still running."""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job['status'] == 'failed':
+        return jsonify({'error': job['error']}), 500
+    if job['status'] != 'done':
+        return jsonify({'status': job['status'], 'stage': job['stage'], 'details': job['details']}), 202
+    return jsonify(job['result'])
+
+# Resumable uploads: POST /upload_session {filename, size} -> {upload_id},
+# PUT /upload_session/<id> with an Upload-Offset header and the next chunk as the body,
+# GET /upload_session/<id> to find where to resume, POST .../complete {mode: clips|full, async: bool}.
+@app.route('/upload_session', methods=['POST'])
+def create_upload_session():
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename', '')
+    if not allowed_file(filename):
+        return jsonify({'error': 'Invalid file type. Allowed types: ' + ', '.join(ALLOWED_EXTENSIONS)}), 400
+    size = data.get('size')
+    upload_id = resumable_uploads.create(filename, int(size) if size is not None else None)
+    return jsonify({'upload_id': upload_id, 'offset': 0}), 201
+
+@app.route('/upload_session/<upload_id>', methods=['GET', 'PUT'])
+def upload_session_chunk(upload_id):
+    session = resumable_uploads.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Unknown or expired upload'}), 404
+    if request.method == 'GET':
+        return jsonify(resumable_uploads.status(session))
+
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({'error': 'Upload-Offset header is required'}), 400
+    new_offset = resumable_uploads.append(session, offset, request.stream)
+    if new_offset is None:
+        # Client and server disagree on how much has arrived, resume from the server's offset
+        return jsonify({'error': 'Offset mismatch', **resumable_uploads.status(session)}), 409
+    return jsonify({'offset': new_offset})
+
+@app.route('/upload_session/<upload_id>/complete', methods=['POST'])
+def complete_upload_session(upload_id):
+    session = resumable_uploads.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Unknown or expired upload'}), 404
+    filename = unique_upload_name(session['filename'])
+    ingested = resumable_uploads.finish(upload_id, os.path.join(app.config['UPLOAD_FOLDER'], filename))
+    if ingested is None:
+        return jsonify({'error': 'Upload is incomplete', **resumable_uploads.status(session)}), 409
+
+    options = request.get_json(silent=True) or {}
+    mode = options.get('mode', 'full')
+    if options.get('async'):
+        return submit_job(ingested, filename, mode)
+    if mode == 'clips':
+        return clip_analysis_response(ingested, filename)
+    return full_analysis_response(ingested)
+
+@app.route('/process_frame', methods=['POST'])
+def handle_frame_processing():
+    """
+    Receives a frame from the frontend and returns YOLO detections.
+    Binary: the raw JPEG as the body (Content-Type: image/jpeg) with ?stream_id=...,
+    answered in the compact format. JSON: {image_data: <data URL>, stream_id}, as before.
+    """
+    if request.mimetype in ('image/jpeg', 'application/octet-stream'):
+        stream_id = request.args.get('stream_id', 'default')
+        read_jpeg = request.get_data
+        compact = True
+    else:
+        data = request.get_json()
+        if not data or 'image_data' not in data:
+            return jsonify({'error': 'No image data provided'}), 400
+        stream_id = str(data.get('stream_id', 'default'))
+        # Only decoded on keyframes
+        read_jpeg = lambda: base64.b64decode(data['image_data'].split(',')[1])
+        compact = data.get('format') == 'compact'
+
+    stream = get_frame_stream(stream_id)
+    
+    try:
+        with stream['lock']:
+            tracks = track_frame(stream, read_jpeg)
+        if tracks is None:
+            return jsonify({'error': 'Could not decode image'}), 400
+        if compact:
+            return jsonify(compact_detections(tracks, stream['scale']))
+        return jsonify({'detections': tracks_to_json(tracks, stream['scale'])})
 
     except Exception as e:
         print(f"Error processing frame: {e}")
         return jsonify({'error': 'Server error during frame processing'}), 500
 
+
+def track_frame(stream, read_jpeg):
+    """
+    Advances a stream by one frame and returns its tracks, or None if the image could not be decoded.
+    read_jpeg() returns the frame's JPEG bytes; it is only called on keyframes.
+    """
+    # Between keyframes the tracker answers without decoding the frame
+    if not stream['stride'].should_detect():
+        return stream['tracker'].step()
+
+    # Large frames are decoded straight to a reduced size, the network input is only input_size px
+    frame, scale = decode_jpeg(read_jpeg(), yolo.input_size)
+    if frame is None:
+        return None
+    if scale != stream['scale']:
+        # Frame size changed, boxes and motion history are in the old scale
+        stream['scale'] = scale
+        stream['tracker'] = SortTracker()
+        stream['motion_gate'] = MotionGate(threshold=MOTION_THRESHOLD)
+
+    # Static scene: coast the tracks as between keyframes, so people who left expire after max_age
+    if not stream['motion_gate'].should_infer(frame):
+        return stream['tracker'].step()
+
+    # Batched with the keyframes of other streams that arrive at the same time
+    boxes, confidences = frame_dispatcher.detect(frame)
+    stream['stride'].update(len(boxes))
+    return stream['tracker'].update(boxes, confidences)
+
+
+# Live browser feeds over one WebSocket (optional, needs flask-sock): send a text message
+# {"stream_id": ...} once, then each frame as a binary JPEG message; every frame is
+# answered with the compact detections.
+if Sock is not None:
+    sock = Sock(app)
+
+    @sock.route('/ws/frames')
+    def frame_socket(ws):
+        stream_id = 'default'
+        while True:
+            message = ws.receive()
+            try:
+                if isinstance(message, str):
+                    control = json.loads(message)
+                    if not isinstance(control, dict):
+                        raise ValueError("control message is not a JSON object")
+                    stream_id = str(control.get('stream_id', stream_id))
+                    continue
+
+                stream = get_frame_stream(stream_id)
+                with stream['lock']:
+                    tracks = track_frame(stream, lambda: message)
+            except Exception as e:
+                if isinstance(message, str):
+                    # Malformed control message: report it and keep the socket open
+                    ws.send(json.dumps({'error': f'Invalid control message: {e}'}))
+                    continue
+                print(f"Error processing frame: {e}")
+                ws.send(json.dumps({'error': 'Server error during frame processing'}))
+                continue
+            if tracks is None:
+                ws.send(json.dumps({'error': 'Could not decode image'}))
+            else:
+                ws.send(json.dumps(compact_detections(tracks, stream['scale']), separators=(',', ':')))
+
+@app.route('/frame_stats')
+def frame_stats():
+    """Returns the motion gate counters for each live stream, for tuning MOTION_THRESHOLD."""
+    with frame_streams_lock:
+        streams = dict(frame_streams)
+    return jsonify({stream_id: state['motion_gate'].stats() for stream_id, state in streams.items()})
+
+@app.route('/inference_stats')
+def inference_stats():
+    """Batch size, queue wait and inference time histograms of the /process_frame dispatcher."""
+    stats = frame_dispatcher.stats()
+    if inference_pool:
+        stats['pool'] = inference_pool.stats()
+    return jsonify(stats)
+
+@app.route('/gemini_stats')
+def gemini_stats():
+    """Quota usage, queue depth and queue wait per priority of the Gemini request scheduler."""
+    return jsonify(gemini_service.get_service().scheduler.stats())
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
     """Serves the uploaded video file to the browser."""
@@ -243,10 +647,9 @@ def uploaded_file(filename):
 
 @app.route('/get_analysis/<filename>')
 def get_analysis(filename):
-    """Returns cached analysis for a video file."""
-    if filename in analysis_cache:
-        return jsonify({'alerts': analysis_cache[filename]})
-    return jsonify({'alerts': []})
+    """Returns cached full-video analysis for a video file ('analyzed': false if there is none)."""
+    alerts = get_cache().get_by_label(filename, 'full')
+    return jsonify({'alerts': alerts if alerts is not None else [], 'analyzed': alerts is not None})
 
 @app.route('/test', methods=['GET'])
 def test():
@@ -262,5 +665,9 @@ if __name__ == '__main__':
     print("SMS Notifications: ENABLED (via sms_notify.py)")
     print("="*50 + "\n")
     
+    # The reloader runs this file twice, only its child process serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
+
     # Run with threading enabled for better performance
     app.run(debug=True, threaded=True, host='0.0.0.0', port=5000)
\ No newline at end of file
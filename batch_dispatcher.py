@@ -0,0 +1,130 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class Histogram:
+    """Counts of observed values per bucket (upper bounds, inclusive), plus count and sum."""
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.bounds):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            else:
+                self.counts[-1] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            labels = [f'<={bound:g}' for bound in self.bounds] + [f'>{self.bounds[-1]:g}']
+            return {
+                'buckets': dict(zip(labels, self.counts)),
+                'count': self.count,
+                'avg': round(self.sum / self.count, 2) if self.count else 0.0,
+            }
+
+
+class InferenceDispatcher:
+    """
+    Micro-batches detector calls from many threads.
+    Requests that arrive within max_wait_ms of the first waiting one (or
+    until max_batch frames are waiting) run as one batched forward pass on
+    a dispatcher thread, and each caller gets its frame's result.
+    Only the dispatcher threads touch the network; use more than one thread
+    only when detect_batch can run batches in parallel (e.g. an InferencePool).
+    detect_batch(frames) must return one result per frame.
+    """
+    def __init__(self, detect_batch, max_batch=8, max_wait_ms=8, threads=1, name='inference-dispatcher'):
+        self.detect_batch = detect_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32])
+        self.queue_wait_ms = Histogram([1, 2, 5, 10, 20, 50, 100, 250])
+        self.inference_ms = Histogram([10, 25, 50, 100, 250, 500, 1000])
+        self._requests = queue.Queue()
+        self._stopped = threading.Event()
+        self._threads = [threading.Thread(target=self._loop, name=f'{name}-{i}', daemon=True)
+                         for i in range(max(1, threads))]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, frame):
+        """Queues a frame and returns a Future for its result."""
+        if self._stopped.is_set():
+            raise RuntimeError("Inference dispatcher is stopped")
+        future = Future()
+        self._requests.put((frame, future, time.perf_counter()))
+        return future
+
+    def detect(self, frame, timeout=None):
+        """Blocking submit(): returns the detector's result for this frame."""
+        return self.submit(frame).result(timeout)
+
+    def stop(self):
+        self._stopped.set()
+        self._requests.put(None)
+        for thread in self._threads:
+            thread.join(timeout=2)
+
+    def _gather(self):
+        """Blocks for the first request, then collects more until the window closes or the batch is full."""
+        first = self._requests.get()
+        if first is None:
+            self._requests.put(None)  # let the other dispatcher threads see it too
+            return None
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._requests.get(timeout=remaining) if remaining > 0 else self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._requests.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._gather()
+            if batch is None:
+                return
+
+            start = time.perf_counter()
+            for _, _, queued_at in batch:
+                self.queue_wait_ms.observe((start - queued_at) * 1000)
+            self.batch_sizes.observe(len(batch))
+
+            try:
+                results = self.detect_batch([frame for frame, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            self.inference_ms.observe((time.perf_counter() - start) * 1000)
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000,
+            'threads': len(self._threads),
+            'pending': self._requests.qsize(),
+            'batch_size': self.batch_sizes.snapshot(),
+            'queue_wait_ms': self.queue_wait_ms.snapshot(),
+            'inference_ms': self.inference_ms.snapshot(),
+        }
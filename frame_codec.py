@@ -0,0 +1,65 @@
+import struct
+
+import cv2
+import numpy as np
+
+# imdecode flags that decode a JPEG straight to 1/2, 1/4 or 1/8 size (libjpeg DCT scaling)
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Start-of-frame markers, they carry the image size
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(data):
+    """(width, height) from a JPEG's headers without decoding it, or None if it is not a JPEG."""
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7):
+            pos += 2
+            continue
+        length = struct.unpack_from('>H', data, pos + 2)[0]
+        if marker in _SOF_MARKERS:
+            if pos + 9 > len(data):
+                return None
+            height, width = struct.unpack_from('>HH', data, pos + 5)
+            return width, height
+        pos += 2 + length
+    return None
+
+
+def reduction_factor(width, height, target_size):
+    """Largest decode reduction (1, 2, 4 or 8) that keeps both sides at least target_size."""
+    factor = 1
+    for candidate in (2, 4, 8):
+        if min(width, height) / candidate >= target_size:
+            factor = candidate
+    return factor
+
+
+def decode_jpeg(data, target_size=None):
+    """
+    Decodes JPEG bytes, at reduced resolution when the image is much larger
+    than target_size (the detector input). Returns (frame, factor), where
+    factor scales coordinates in frame back to the original image;
+    frame is None if the data could not be decoded.
+    """
+    factor = 1
+    if target_size:
+        size = jpeg_size(data)
+        if size:
+            factor = reduction_factor(*size, target_size)
+    frame = cv2.imdecode(np.frombuffer(data, np.uint8), REDUCED_DECODE_FLAGS[factor])
+    return frame, factor
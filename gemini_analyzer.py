@@ -1,7 +1,13 @@
+import asyncio
 import google.generativeai as genai
 import time
 import os
 import random
+import gemini_service
+from gemini_scheduler import is_rate_limited
+from incidents import INCIDENT_SCHEMA, IncidentStreamParser, incident_to_alert
+from media_tools import ANALYSIS_PROXY_ENABLED, ANALYSIS_PROXY_VERSION
+from keyframes import KEYFRAME_VERSION, extract_keyframes
 
 # Import the API key from the config file
 from config import GEMINI_API_KEY
@@ -9,12 +15,33 @@ from config import GEMINI_API_KEY
 # DEMO MODE - Set to True to use mock data instead of real API calls
 DEMO_MODE = False  # Change to True to test without using API quota
 
+# Models used for analysis. Bump PROMPT_VERSION whenever a prompt changes:
+# cached analyses are keyed by these (and the upload proxy profile), so old results stop being served.
+CLIP_MODEL = "models/gemini-2.5-flash-lite"
+FULL_VIDEO_MODEL = "models/gemini-1.5-flash-latest"
+PROMPT_VERSION = 1
+# How clips are sent: 'video' (File API upload) or 'keyframes' (inline JPEG frames, no upload wait)
+CLIP_INPUT = os.getenv('GEMINI_CLIP_INPUT', 'video')
+CLIP_ANALYSIS_VERSION = (f"{CLIP_MODEL}/prompt-v{PROMPT_VERSION}/"
+                         f"{KEYFRAME_VERSION if CLIP_INPUT == 'keyframes' else ANALYSIS_PROXY_VERSION}")
+# Full-video analysis streams a JSON incident list (GEMINI_STREAM_INCIDENTS=0: free text parsed afterwards)
+STREAM_INCIDENTS = os.getenv('GEMINI_STREAM_INCIDENTS', '1') != '0'
+FULL_VIDEO_ANALYSIS_VERSION = (f"{FULL_VIDEO_MODEL}/prompt-v{PROMPT_VERSION}/{ANALYSIS_PROXY_VERSION}"
+                               f"{'/json-stream' if STREAM_INCIDENTS else ''}")
+
+# Responses returned in place of an analysis when something went wrong
+ANALYSIS_ERROR_PREFIXES = (
+    "Video processing failed",
+    "An error occurred while analyzing the video",
+    "No incidents detected -",
+)
+
 # Configure the Gemini API
 try:
     if not GEMINI_API_KEY or "AIza" not in GEMINI_API_KEY:
         raise ValueError("Gemini API Key is missing or invalid. Please add it to your config.py file.")
     
-    genai.configure(api_key=GEMINI_API_KEY)
+    gemini_service.configure(GEMINI_API_KEY)
     print("✅ Successfully configured Gemini AI using API Key.")
     
 except Exception as e:
@@ -22,50 +49,75 @@ except Exception as e:
     print("⚠️  Running in DEMO MODE with mock data")
     DEMO_MODE = True
 
+CLIP_PROMPT = (
+    "You are a highly vigilant security AI system. Your primary task is to identify and describe acts of physical violence, aggression, assault, or fighting in this video clip. "
+    "Pay close attention to sudden, fast movements, people pushing, shoving, punching, kicking, or anyone falling to the ground unexpectedly. "
+    "Describe the specific actions observed. "
+    "If a physical altercation is detected, begin your response with 'ALERT: Physical altercation detected.' followed by a description. "
+    "If the scene appears calm and normal, simply state 'Scene appears normal.' "
+)
+
+def is_analysis_error(text):
+    """True if text is one of the fallback responses above rather than a real analysis."""
+    return not text or text.strip() == "No incidents detected" or text.startswith(ANALYSIS_ERROR_PREFIXES)
+
 def analyze_video_clip(video_path):
     """
     Original function for analyzing video clips.
     Kept for backwards compatibility.
     """
+    return gemini_service.run(analyze_video_clip_async(video_path))
+
+async def analyze_video_clip_async(video_path):
+    """
+    analyze_video_clip as a coroutine, so many clips can be analyzed on one event loop.
+    With CLIP_INPUT 'keyframes' the clip is sent as inline frames instead of an upload.
+    """
+    service = gemini_service.get_service()
+    if CLIP_INPUT == 'keyframes':
+        try:
+            keyframes = await asyncio.to_thread(extract_keyframes, video_path)
+            if keyframes:
+                print(f"Sending {len(keyframes)} keyframes of {video_path} to Gemini...")
+                return await service.analyze_keyframes(keyframes, CLIP_PROMPT, CLIP_MODEL)
+        except Exception as e:
+            print(f"✗ An error occurred during Gemini analysis: {e}")
+            return f"An error occurred while analyzing the video: {e}"
+        print(f"Could not extract keyframes from {video_path}, uploading the video instead.")
+
     print(f"Uploading file to Gemini: {video_path}...")
     try:
-        video_file = genai.upload_file(path=video_path)
-
-        # Poll the API to wait until the video is processed and ready
-        while video_file.state.name == "PROCESSING":
+        video_file = await service.upload(video_path, proxy=True)
+        try:
+            # Wait until the video is processed and ready
             print("Waiting for video to be processed...")
-            time.sleep(2)
-            video_file = genai.get_file(video_file.name)
-
-        if video_file.state.name == "FAILED":
-            print(f"✗ ERROR: Video processing failed for {video_path}")
-            return f"Video processing failed. State: {video_file.state.name}"
-
-        print(f"✅ File uploaded and processed successfully: {video_file.name}")
-
-        prompt = (
-            "You are a highly vigilant security AI system. Your primary task is to identify and describe acts of physical violence, aggression, assault, or fighting in this video clip. "
-            "Pay close attention to sudden, fast movements, people pushing, shoving, punching, kicking, or anyone falling to the ground unexpectedly. "
-            "Describe the specific actions observed. "
-            "If a physical altercation is detected, begin your response with 'ALERT: Physical altercation detected.' followed by a description. "
-            "If the scene appears calm and normal, simply state 'Scene appears normal.' "
-        )
-
-        model = genai.GenerativeModel(model_name="models/gemini-2.5-flash-lite")
-        print("Generating content with Gemini model...")
-        response = model.generate_content([prompt, video_file])
+            try:
+                video_file = await service.wait_until_ready(video_file)
+            except gemini_service.FileProcessingError as e:
+                print(f"✗ ERROR: Video processing failed for {video_path}")
+                return f"Video processing failed. State: {e.state}"
 
-        # Clean up by deleting the file from Google's servers
-        print(f"Deleting uploaded file: {video_file.name}")
-        genai.delete_file(video_file.name)
+            print(f"✅ File uploaded and processed successfully: {video_file.name}")
 
-        return response.text
+            print("Generating content with Gemini model...")
+            return await service.generate(CLIP_MODEL, [CLIP_PROMPT, video_file])
+        finally:
+            # Clean up by deleting the file from Google's servers
+            print(f"Deleting uploaded file: {video_file.name}")
+            await service.delete(video_file)
 
     except Exception as e:
         print(f"✗ An error occurred during Gemini analysis: {e}")
         return f"An error occurred while analyzing the video: {e}"
 
-def analyze_full_video_with_timestamps(video_path, duration):
+def analyze_full_video_with_timestamps(video_path, duration, progress=None, proxy=True):
+    return gemini_service.run(analyze_full_video_with_timestamps_async(video_path, duration, progress, proxy))
+
+async def analyze_full_video_with_timestamps_async(video_path, duration, progress=None, proxy=True):
+    """
+    progress(stage), if given, is called as the analysis moves through uploading/processing/analyzing.
+    proxy=False uploads video_path as it is (e.g. a highlight reel that is already in the proxy profile).
+    """
 
     print(f"\n{'='*60}")
     print(f"GEMINI API ANALYSIS")
@@ -76,7 +128,7 @@ def analyze_full_video_with_timestamps(video_path, duration):
     # DEMO MODE - Return mock violence detection data
     if DEMO_MODE:
         print("⚠️  DEMO MODE ACTIVE - Using mock data")
-        time.sleep(2)  # Simulate processing time
+        await asyncio.sleep(2)  # Simulate processing time
         
         # Generate some realistic mock timestamps for testing
         mock_responses = [
@@ -115,38 +167,34 @@ def analyze_full_video_with_timestamps(video_path, duration):
         file_size = os.path.getsize(video_path) / (1024 * 1024)  # Size in MB
         print(f"File size: {file_size:.2f} MB")
         
-        if file_size > 200:  # Gemini has file size limits
+        if file_size > 200 and not (proxy and ANALYSIS_PROXY_ENABLED):  # Gemini has file size limits
             print(f"WARNING: File size {file_size:.2f} MB may be too large for Gemini API")
         
         # Upload the full video
+        service = gemini_service.get_service()
         print("Uploading video to Gemini API...")
-        video_file = genai.upload_file(path=video_path)
+        if progress:
+            progress('uploading')
+        video_file = await service.upload(video_path, proxy=proxy)
         print(f"Upload initiated. File name: {video_file.name}")
         
         # Wait for processing with timeout
         max_wait_time = 120  # Maximum wait time in seconds (2 minutes)
-        wait_interval = 3
-        total_waited = 0
-        
-        while video_file.state.name == "PROCESSING" and total_waited < max_wait_time:
-            print(f"Processing video... ({total_waited}s / {max_wait_time}s)")
-            time.sleep(wait_interval)
-            total_waited += wait_interval
-            video_file = genai.get_file(video_file.name)
-        
-        if video_file.state.name == "FAILED":
-            print(f"✗ ERROR: Video processing failed. State: {video_file.state.name}")
+        print(f"Processing video... (up to {max_wait_time}s)")
+        if progress:
+            progress('processing')
+        started = time.monotonic()
+        try:
+            video_file = await service.wait_until_ready(video_file, timeout=max_wait_time)
+        except gemini_service.FileProcessingError as e:
+            print(f"✗ ERROR: Video processing failed. State: {e.state}")
             return "No incidents detected - processing failed"
-        
-        if total_waited >= max_wait_time:
+        except TimeoutError:
             print(f"✗ ERROR: Timeout waiting for video processing")
-            try:
-                genai.delete_file(video_file.name)
-            except:
-                pass
+            await service.delete(video_file)
             return "No incidents detected - processing timeout"
         
-        print(f"✅ Video processed successfully in {total_waited} seconds")
+        print(f"✅ Video processed successfully in {time.monotonic() - started:.0f} seconds")
         
         # Create a detailed prompt for timestamp extraction
         duration_min = int(duration // 60)
@@ -185,40 +233,24 @@ BE SPECIFIC:
 
         # Generate analysis
         print("Analyzing video for security threats...")
-        model = genai.GenerativeModel(model_name="models/gemini-1.5-flash-latest")
-        
+        if progress:
+            progress('analyzing')
         try:
-            response = model.generate_content([prompt, video_file])
-            analysis_text = response.text
+            analysis_text = await service.generate(FULL_VIDEO_MODEL, [prompt, video_file])
             print(f"✅ Analysis complete")
         except Exception as e:
             print(f"✗ ERROR during content generation: {e}")
             
-            # Check if it's a quota error
-            if "429" in str(e) or "quota" in str(e).lower():
-                print("\n" + "="*60)
-                print("⚠️  QUOTA EXCEEDED - Switching to DEMO MODE")
-                print("Your Gemini API quota has been exceeded.")
-                print("The app will now use simulated violence detection.")
-                print("To use real detection again:")
-                print("1. Wait 24 hours for quota reset, OR")
-                print("2. Get a new API key from another Google account")
-                print("="*60 + "\n")
-                
-                # Return demo data
-                return f"""0:15-0:22: Two individuals engaged in physical altercation
-0:45-0:52: Person appears to throw a punch at another individual
-1:18-1:25: Aggressive confrontation detected"""
-            
-            analysis_text = "No incidents detected - analysis error"
+            # The scheduler already retried with backoff; report the failure rather than made-up incidents
+            if is_rate_limited(e):
+                print("⚠️  Gemini API quota exceeded after retries - this video was not analyzed")
+                analysis_text = "No incidents detected - quota exceeded, video not analyzed"
+            else:
+                analysis_text = "No incidents detected - analysis error"
         
         # Clean up - delete the uploaded file
-        try:
-            print("Cleaning up uploaded file...")
-            genai.delete_file(video_file.name)
-            print("✅ Cleanup complete")
-        except Exception as e:
-            print(f"WARNING: Could not delete uploaded file: {e}")
+        print("Cleaning up uploaded file...")
+        await service.delete(video_file)
         
         return analysis_text
         
@@ -227,15 +259,80 @@ BE SPECIFIC:
         import traceback
         traceback.print_exc()
         
-        # If any error occurs, provide demo data
-        if "quota" in str(e).lower():
-            print("\nUsing DEMO data due to quota limits...")
-            return f"""0:10-0:18: Violence detected - physical altercation
-0:35-0:42: Aggressive behavior observed
-1:00-1:08: Fighting between multiple individuals"""
-        
+        if is_rate_limited(e):
+            return "No incidents detected - quota exceeded, video not analyzed"
         return "No incidents detected - error occurred"
 
+def analyze_full_video_incidents(video_path, duration, on_incident=None, progress=None, proxy=True):
+    return gemini_service.run(analyze_full_video_incidents_async(video_path, duration, on_incident, progress, proxy))
+
+async def analyze_full_video_incidents_async(video_path, duration, on_incident=None, progress=None, proxy=True):
+    """
+    Streaming, structured variant of analyze_full_video_with_timestamps: the model
+    answers with a JSON array of incidents (INCIDENT_SCHEMA), and each incident is
+    decoded and passed to on_incident(alert) as soon as its object is complete.
+    Returns (alerts, complete); complete is False if the analysis failed or the
+    response was cut off, in which case alerts holds what arrived before that.
+    """
+    alerts = []
+    service = gemini_service.get_service()
+    try:
+        if progress:
+            progress('uploading')
+        video_file = await service.upload(video_path, proxy=proxy)
+    except Exception as e:
+        print(f"✗ ERROR uploading {video_path}: {e}")
+        return alerts, False
+
+    try:
+        if progress:
+            progress('processing')
+        try:
+            video_file = await service.wait_until_ready(video_file, timeout=120)
+        except (gemini_service.FileProcessingError, TimeoutError) as e:
+            print(f"✗ ERROR: {e}")
+            return alerts, False
+
+        prompt = f"""You are an advanced AI security surveillance system analyzing a video that is {int(duration // 60)} minutes and {int(duration % 60)} seconds long.
+
+Detect ANY physical violence or aggressive behavior: fights, punching, kicking, hitting, pushing, shoving,
+grabbing, people being knocked down, aggressive confrontations, threatening gestures, any physical assault.
+
+Answer with a JSON array with one object per incident, in the order they happen:
+- "start", "end": timestamps in M:SS format from the start of the video (e.g. "0:45", "1:30")
+- "type": "VIOLENCE_DETECTED", or "SUSPICIOUS_BEHAVIOR" for concerning but not violent behavior
+- "description": what happened
+Answer [] if there are no incidents. Be thorough - even minor aggressive actions should be reported."""
+
+        if progress:
+            progress('analyzing')
+        parser = IncidentStreamParser()
+        generation_config = {'response_mime_type': 'application/json', 'response_schema': INCIDENT_SCHEMA}
+        try:
+            async for chunk in service.generate_stream(FULL_VIDEO_MODEL, [prompt, video_file],
+                                                       generation_config=generation_config):
+                for incident in parser.feed(chunk):
+                    alert = incident_to_alert(incident)
+                    if alert is None:
+                        continue
+                    print(f"🚨 Incident {alert['type']}: {alert['description']}")
+                    alerts.append(alert)
+                    if on_incident:
+                        on_incident(alert)
+        except Exception as e:
+            if is_rate_limited(e):
+                print("⚠️  Gemini API quota exceeded after retries - this video was not analyzed")
+            else:
+                print(f"✗ ERROR during content generation: {e}")
+            return alerts, False
+
+        if not parser.complete:
+            print(f"✗ ERROR: Incomplete incident list from Gemini: {''.join(parser.text)[:500]}")
+        print(f"✅ Analysis complete, {len(alerts)} incidents")
+        return alerts, parser.complete
+    finally:
+        await service.delete(video_file)
+
 def test_gemini_connection():
     """
     Test function to verify Gemini API connection.
@@ -0,0 +1,223 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import time
+
+from google.api_core import exceptions as api_exceptions
+
+from batch_dispatcher import Histogram
+
+# API quota for generation requests; 0 disables a limit
+GEMINI_RPM = int(os.getenv('GEMINI_RPM', '15'))
+GEMINI_TPM = int(os.getenv('GEMINI_TPM', '1000000'))
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '5'))
+BACKOFF_INITIAL_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 60.0
+
+# Rough token costs used to reserve TPM before a request; corrected from usage_metadata afterwards
+TOKENS_PER_IMAGE = 258
+TOKENS_PER_VIDEO_SECOND = 300  # frames sampled at 1 fps plus audio
+TOKENS_PER_FILE = 3000  # uploaded file of unknown duration
+
+# Lower runs first
+LIVE, OFFLINE = 0, 1
+PRIORITY_NAMES = {LIVE: 'live', OFFLINE: 'offline'}
+
+_priority = contextvars.ContextVar('gemini_priority', default=OFFLINE)
+
+_RETRYABLE = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.ResourceExhausted,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.InternalServerError,
+    api_exceptions.DeadlineExceeded,
+)
+
+
+@contextlib.contextmanager
+def request_priority(level):
+    """Gemini calls made inside the block (in this task or thread) are queued at `level`."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def is_rate_limited(error):
+    return (isinstance(error, (api_exceptions.TooManyRequests, api_exceptions.ResourceExhausted))
+            or '429' in str(error))
+
+
+def is_retryable(error):
+    return isinstance(error, _RETRYABLE) or is_rate_limited(error)
+
+
+def estimate_tokens(contents):
+    """Rough prompt size of generate_content contents: text, inline images and uploaded files."""
+    total = 0
+    for part in contents:
+        if isinstance(part, str):
+            total += len(part) // 4
+        elif isinstance(part, dict):
+            total += TOKENS_PER_IMAGE
+        else:
+            duration = getattr(getattr(part, 'video_metadata', None), 'video_duration', None)
+            seconds = duration.total_seconds() if hasattr(duration, 'total_seconds') else 0
+            total += int(seconds * TOKENS_PER_VIDEO_SECOND) if seconds else TOKENS_PER_FILE
+    return total
+
+
+class TokenBucket:
+    """Allows `per_minute` units per minute, refilled continuously. per_minute <= 0 means unlimited."""
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` can be taken (requests larger than the bucket only need a full bucket)."""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount):
+        """Takes amount; the level may go negative, which delays later requests."""
+        if self.capacity > 0:
+            self._refill()
+            self.level -= amount
+
+
+class GeminiScheduler:
+    """
+    Single gate for Gemini API calls, on the event loop that makes them.
+    Generation requests wait in a priority queue (live before offline, FIFO
+    within a priority) until both the requests-per-minute and the
+    tokens-per-minute buckets allow them. Failed calls that are worth
+    retrying (429, 5xx) are retried with exponential backoff and jitter;
+    a 429 also pauses the queue for everyone, so the quota can recover.
+    File API calls (upload, status, delete) are retried but not rate limited.
+    """
+    def __init__(self, rpm=GEMINI_RPM, tpm=GEMINI_TPM, max_retries=GEMINI_MAX_RETRIES,
+                 backoff_initial=BACKOFF_INITIAL_SECONDS, backoff_max=BACKOFF_MAX_SECONDS):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.queue_wait_ms = {name: Histogram([10, 100, 1000, 5000, 15000, 60000, 300000])
+                              for name in PRIORITY_NAMES.values()}
+        self.counters = {'calls': 0, 'retries': 0, 'rate_limited': 0, 'failed': 0, 'tokens': 0}
+        self._waiting = []  # heap of (priority, seq, future, tokens)
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._loop = None
+        self._wakeup = None
+
+    def _bind(self):
+        """Creates the queue's asyncio state on the running loop (again if the loop changed)."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._waiting = []
+            self._wakeup = asyncio.Event()
+            loop.create_task(self._pump())
+
+    async def acquire(self, tokens, priority):
+        """Waits for a turn to send a generation request costing `tokens`."""
+        self._bind()
+        future = self._loop.create_future()
+        heapq.heappush(self._waiting, (priority, next(self._seq), future, tokens))
+        self._wakeup.set()
+        queued_at = time.perf_counter()
+        await future
+        self.queue_wait_ms[PRIORITY_NAMES[priority]].observe((time.perf_counter() - queued_at) * 1000)
+
+    async def _pump(self):
+        """Lets the head of the queue through whenever the quota allows it."""
+        wakeup = self._wakeup
+        while True:
+            if not self._waiting:
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+            _, _, future, tokens = self._waiting[0]
+            if future.done():  # the waiting task was cancelled
+                heapq.heappop(self._waiting)
+                continue
+
+            delay = max(self._paused_until - time.monotonic(), self.requests.wait_time(1),
+                        self.tokens.wait_time(tokens))
+            if delay > 0:
+                # Re-check early if something is queued meanwhile (it may have a higher priority)
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._waiting)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            future.set_result(None)
+
+    async def call(self, fn, *args, tokens=0, rate_limited=False, **kwargs):
+        """
+        Runs a blocking SDK call on a worker thread, after waiting for quota if
+        rate_limited, retrying errors worth retrying. The priority comes from
+        request_priority() (OFFLINE by default).
+        """
+        priority = _priority.get()
+        attempt = 0
+        while True:
+            if rate_limited:
+                await self.acquire(tokens, priority)
+            try:
+                result = await asyncio.to_thread(fn, *args, **kwargs)
+                self.counters['calls'] += 1
+                return result
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    self.counters['failed'] += 1
+                    raise
+                delay = min(self.backoff_max, self.backoff_initial * 2 ** attempt) * random.uniform(0.5, 1.5)
+                if is_rate_limited(e):
+                    self.counters['rate_limited'] += 1
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                    if self._wakeup is not None:
+                        self._wakeup.set()
+                self.counters['retries'] += 1
+                attempt += 1
+                print(f"⚠️ Gemini call failed ({e}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def settle(self, estimated, actual):
+        """Corrects the TPM bucket once a request's real token count is known."""
+        if actual:
+            self.tokens.take(actual - estimated)
+        self.counters['tokens'] += actual or estimated
+
+    def stats(self):
+        waiting = list(self._waiting)
+        return {
+            'rpm': self.requests.capacity,
+            'tpm': self.tokens.capacity,
+            'paused_seconds': round(max(0.0, self._paused_until - time.monotonic()), 1),
+            'queue_depth': {name: sum(1 for item in waiting if item[0] == level and not item[2].done())
+                            for level, name in PRIORITY_NAMES.items()},
+            'queue_wait_ms': {name: histogram.snapshot() for name, histogram in self.queue_wait_ms.items()},
+            **self.counters,
+        }
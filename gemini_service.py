@@ -0,0 +1,220 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+
+from media_tools import make_analysis_proxy
+from gemini_scheduler import GeminiScheduler, estimate_tokens
+
+# Point the SDK at another endpoint (e.g. a local fake server for tests): http://localhost:8080
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT')
+
+# Readiness polling: exponential backoff with jitter, capped, with an overall timeout
+POLL_INITIAL_SECONDS = 1.0
+POLL_MAX_SECONDS = 10.0
+READY_TIMEOUT_SECONDS = 300
+
+# Threads that run the blocking SDK calls. Waiting for file readiness does not use one.
+SDK_THREADS = int(os.getenv('GEMINI_SDK_THREADS', '16'))
+
+
+class StreamInterrupted(RuntimeError):
+    """A streamed generation failed after part of the response had been delivered (so it is not retried)."""
+
+
+class FileProcessingError(RuntimeError):
+    """Gemini could not process an uploaded file."""
+    def __init__(self, file_name, state):
+        super().__init__(f"Video processing failed for {file_name}. State: {state}")
+        self.file_name = file_name
+        self.state = state
+
+
+def configure(api_key):
+    """genai.configure() that also applies GEMINI_API_ENDPOINT when it is set."""
+    if not GEMINI_API_ENDPOINT:
+        genai.configure(api_key=api_key)
+        return
+
+    endpoint = GEMINI_API_ENDPOINT.rstrip('/')
+    # Uploads go through a discovery document, which the SDK fetches from a fixed URL
+    genai_client.GENAI_API_DISCOVERY_URL = f"{endpoint}/$discovery/rest"
+    genai.configure(api_key=api_key, transport='rest',
+                    client_options={'api_endpoint': endpoint})
+
+
+class GenAIBackend:
+    """Blocking calls into the google-generativeai SDK. Swap for a fake in tests."""
+    def upload_file(self, path, mime_type=None):
+        return genai.upload_file(path=path, mime_type=mime_type)
+
+    def get_file(self, name):
+        return genai.get_file(name)
+
+    def delete_file(self, name):
+        genai.delete_file(name)
+
+    def generate(self, model_name, contents, **kwargs):
+        model = genai.GenerativeModel(model_name=model_name)
+        return model.generate_content(contents, **kwargs)
+
+    def generate_stream(self, model_name, contents, **kwargs):
+        """Iterator over the response chunks as they are generated."""
+        model = genai.GenerativeModel(model_name=model_name)
+        return iter(model.generate_content(contents, stream=True, **kwargs))
+
+
+class GeminiService:
+    """
+    Upload, readiness polling, generation and cleanup as coroutines.
+    Blocking SDK calls run on a thread pool; waiting for a file to leave
+    PROCESSING is an asyncio sleep, so one event loop can keep many
+    analyses in flight without tying up a thread per analysis.
+    Every SDK call goes through the scheduler (quota, priorities, retries).
+    """
+    def __init__(self, backend=None, poll_initial=POLL_INITIAL_SECONDS, poll_max=POLL_MAX_SECONDS,
+                 ready_timeout=READY_TIMEOUT_SECONDS, scheduler=None):
+        self.backend = backend or GenAIBackend()
+        self.scheduler = scheduler or GeminiScheduler()
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.ready_timeout = ready_timeout
+
+    async def upload(self, path, mime_type=None, proxy=False):
+        """Uploads a local file. With proxy=True a video is uploaded as its analysis proxy, if one can be made."""
+        proxy_path = await asyncio.to_thread(make_analysis_proxy, path) if proxy else None
+        try:
+            return await self.scheduler.call(self.backend.upload_file, proxy_path or path, mime_type)
+        finally:
+            if proxy_path:
+                os.remove(proxy_path)
+
+    async def wait_until_ready(self, file, timeout=None):
+        """Polls until the file leaves PROCESSING. Raises FileProcessingError or TimeoutError."""
+        timeout = timeout or self.ready_timeout
+        deadline = time.monotonic() + timeout
+        delay = self.poll_initial
+
+        while file.state.name == "PROCESSING":
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Timed out after {timeout}s waiting for {file.name} to be processed")
+            # Full delay +/- 50% jitter so many concurrent polls do not line up
+            await asyncio.sleep(min(remaining, delay * random.uniform(0.5, 1.5)))
+            delay = min(self.poll_max, delay * 2)
+            file = await self.scheduler.call(self.backend.get_file, file.name)
+
+        if file.state.name == "FAILED":
+            raise FileProcessingError(file.name, file.state.name)
+        return file
+
+    async def generate(self, model_name, contents, **kwargs):
+        estimated = estimate_tokens(contents)
+        response = await self.scheduler.call(self.backend.generate, model_name, contents,
+                                             tokens=estimated, rate_limited=True, **kwargs)
+        usage = getattr(response, 'usage_metadata', None)
+        self.scheduler.settle(estimated, getattr(usage, 'total_token_count', 0))
+        return response.text
+
+    async def generate_stream(self, model_name, contents, **kwargs):
+        """generate() as an async iterator over the response text, chunk by chunk as it is generated."""
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        estimated = estimate_tokens(contents)
+        usage = {'tokens': 0}
+
+        def consume():
+            # Runs on an SDK thread; chunks reach the loop in order, before the call completes
+            started = False
+            try:
+                for chunk in self.backend.generate_stream(model_name, contents, **kwargs):
+                    started = True
+                    tokens = getattr(getattr(chunk, 'usage_metadata', None), 'total_token_count', 0)
+                    usage['tokens'] = tokens or usage['tokens']
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk.text)
+            except Exception as e:
+                if started:
+                    # Not retryable: the message leaves out the cause so it is never mistaken for a 429
+                    raise StreamInterrupted(f"Response stream broke off ({type(e).__name__})") from e
+                raise
+
+        call = asyncio.ensure_future(self.scheduler.call(consume, tokens=estimated, rate_limited=True))
+        call.add_done_callback(lambda _: chunks.put_nowait(None))
+        while True:
+            text = await chunks.get()
+            if text is None:
+                break
+            yield text
+        await call  # raises the error, if any
+        self.scheduler.settle(estimated, usage['tokens'])
+
+    async def delete(self, file):
+        """Deletes an uploaded file, logging (not raising) on failure."""
+        try:
+            await self.scheduler.call(self.backend.delete_file, file.name)
+        except Exception as e:
+            print(f"WARNING: Could not delete uploaded file {file.name}: {e}")
+
+    async def analyze_video(self, path, prompt, model_name, prompt_first=True, ready_timeout=None, proxy=True):
+        """Upload (as the analysis proxy) -> wait for processing -> generate -> delete. Returns the response text."""
+        file = await self.upload(path, proxy=proxy)
+        try:
+            file = await self.wait_until_ready(file, ready_timeout)
+            contents = [prompt, file] if prompt_first else [file, prompt]
+            return await self.generate(model_name, contents)
+        finally:
+            await self.delete(file)
+
+    async def analyze_keyframes(self, keyframes, prompt, model_name, prompt_first=True):
+        """
+        Generates from inline JPEG keyframes (keyframes.Keyframe) instead of an
+        uploaded video: no upload and no PROCESSING wait. Returns the response text.
+        """
+        parts = [f"The video is given as {len(keyframes)} frames sampled from it, in order, "
+                 f"each preceded by its timestamp (M:SS.s)."]
+        for keyframe in keyframes:
+            parts.append(f"Frame at {keyframe.label}:")
+            parts.append({'mime_type': 'image/jpeg', 'data': keyframe.jpeg})
+        contents = [prompt, *parts] if prompt_first else [*parts, prompt]
+        return await self.generate(model_name, contents)
+
+
+_service = None
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_service():
+    """The process-wide GeminiService."""
+    global _service
+    with _loop_lock:
+        if _service is None:
+            _service = GeminiService()
+        return _service
+
+
+def get_loop():
+    """The background event loop that runs Gemini coroutines for synchronous callers."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=SDK_THREADS, thread_name_prefix='gemini-sdk'))
+            threading.Thread(target=loop.run_forever, name='gemini-loop', daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def submit(coro):
+    """Schedules a coroutine on the background loop and returns a concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro, timeout=None):
+    """Runs a coroutine on the background loop and blocks until it finishes."""
+    return submit(coro).result(timeout)
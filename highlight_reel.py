@@ -0,0 +1,110 @@
+import bisect
+import os
+import re
+import tempfile
+
+from activity_screen import get_screener
+from media_tools import concat_intervals
+
+# Long recordings are condensed to their human-active intervals before they are sent to Gemini
+HIGHLIGHT_REEL = os.getenv('HIGHLIGHT_REEL', '1') != '0'
+HIGHLIGHT_MIN_SECONDS = float(os.getenv('HIGHLIGHT_MIN_SECONDS', '120'))  # shorter videos are sent whole
+HIGHLIGHT_PAD_SECONDS = float(os.getenv('HIGHLIGHT_PAD_SECONDS', '2'))  # context kept around activity
+HIGHLIGHT_MAX_FRACTION = 0.7  # not worth condensing a video that is mostly active
+# Part of analysis cache keys
+HIGHLIGHT_VERSION = (f"reel-{HIGHLIGHT_MIN_SECONDS:g}s-pad{HIGHLIGHT_PAD_SECONDS:g}"
+                     if HIGHLIGHT_REEL else "no-reel")
+
+_TIMESTAMP = re.compile(r'\b(\d{1,3}):(\d{2})\b')
+
+
+def active_intervals(video_path, duration, pad_seconds=HIGHLIGHT_PAD_SECONDS, screener=None):
+    """
+    [(start, end)] seconds of the video where people are moving, found by the
+    local screener, padded by pad_seconds and merged where they overlap.
+    """
+    screener = screener or get_screener()
+    intervals = []
+    for seconds, moving, people in screener.samples(video_path):
+        if not (moving and people):
+            continue
+        start = max(0.0, seconds - screener.sample_seconds - pad_seconds)
+        end = min(duration, seconds + screener.sample_seconds + pad_seconds)
+        if intervals and start <= intervals[-1][1]:
+            intervals[-1] = (intervals[-1][0], max(intervals[-1][1], end))
+        else:
+            intervals.append((start, end))
+    return intervals
+
+
+def worth_condensing(intervals, duration):
+    """True if a reel of these intervals is meaningfully shorter than the video."""
+    active = sum(end - start for start, end in intervals)
+    return duration >= HIGHLIGHT_MIN_SECONDS and active <= duration * HIGHLIGHT_MAX_FRACTION
+
+
+class HighlightReel:
+    """
+    A condensed video made of intervals of an original video, played back to
+    back, and the mapping from reel time back to original time.
+    """
+    def __init__(self, path, intervals):
+        self.path = path
+        self.intervals = list(intervals)
+        self._reel_starts = []
+        position = 0.0
+        for start, end in self.intervals:
+            self._reel_starts.append(position)
+            position += end - start
+        self.duration = position
+
+    def to_original(self, seconds):
+        """Original-video time of a point in the reel."""
+        if not self.intervals:
+            return seconds
+        i = max(0, bisect.bisect_right(self._reel_starts, seconds) - 1)
+        start, end = self.intervals[i]
+        return min(end, start + seconds - self._reel_starts[i])
+
+    def remap_timestamps(self, text):
+        """Rewrites every M:SS timestamp in text from reel time to original time (H:MM:SS past an hour)."""
+        def remap(match):
+            seconds = int(self.to_original(int(match.group(1)) * 60 + int(match.group(2))))
+            hours, seconds = divmod(seconds, 3600)
+            if hours:
+                return f"{hours}:{seconds // 60:02d}:{seconds % 60:02d}"
+            return f"{seconds // 60}:{seconds % 60:02d}"
+        return _TIMESTAMP.sub(remap, text)
+
+    def remap_alerts(self, alerts):
+        """
+        Maps alerts parsed from the reel's analysis to original time: their
+        start/end seconds, and the timestamps quoted in their descriptions.
+
+        >>> reel = HighlightReel('reel.mp4', [(10, 40), (6000, 6100)])
+        >>> alert, = reel.remap_alerts([{'start_time': 35, 'end_time': 50, 'description': 'fight from 0:35 to 0:50'}])
+        >>> alert['start_time'], alert['end_time'], alert['description']
+        (6005.0, 6020.0, 'fight from 1:40:05 to 1:40:20')
+        """
+        for alert in alerts:
+            alert['start_time'] = self.to_original(alert['start_time'])
+            alert['end_time'] = self.to_original(alert['end_time'])
+            alert['description'] = self.remap_timestamps(alert.get('description', ''))
+        return alerts
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def build_highlight_reel(video_path, intervals):
+    """Cuts the intervals out of the video into one reel. Returns a HighlightReel, or None if ffmpeg fails."""
+    temp_file = tempfile.NamedTemporaryFile(suffix='_reel.mp4', delete=False)
+    temp_file.close()
+    if not concat_intervals(video_path, intervals, temp_file.name):
+        print("⚠️ Highlight reel skipped (ffmpeg failed or timed out), sending the whole video instead")
+        os.remove(temp_file.name)
+        return None
+    return HighlightReel(temp_file.name, intervals)
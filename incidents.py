@@ -0,0 +1,106 @@
+import json
+
+ALERT_TYPES = ('VIOLENCE_DETECTED', 'SUSPICIOUS_BEHAVIOR')
+
+# response_schema for full-video analysis: a JSON array of incidents, [] when nothing happened
+INCIDENT_SCHEMA = {
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'properties': {
+            'start': {'type': 'string', 'description': 'Start of the incident, M:SS from the start of the video'},
+            'end': {'type': 'string', 'description': 'End of the incident, M:SS from the start of the video'},
+            'type': {'type': 'string', 'enum': list(ALERT_TYPES)},
+            'description': {'type': 'string'},
+        },
+        'required': ['start', 'end', 'type', 'description'],
+    },
+}
+
+
+def _seconds(value):
+    """Seconds from 'M:SS', 'H:MM:SS' or a plain number of seconds."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    seconds = 0.0
+    for part in str(value).strip().split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def incident_to_alert(incident):
+    """Turns one incident object from the model into an alert dict, or None if it is unusable."""
+    try:
+        start = _seconds(incident['start'])
+        end = _seconds(incident.get('end', start))
+    except (KeyError, TypeError, ValueError):
+        return None
+    if end <= start:
+        end = start + 5  # same default window as parse_timestamps_from_analysis
+    alert_type = incident.get('type')
+    return {
+        'start_time': start,
+        'end_time': end,
+        'type': alert_type if alert_type in ALERT_TYPES else 'VIOLENCE_DETECTED',
+        'description': str(incident.get('description', '')).strip(),
+    }
+
+
+class IncidentStreamParser:
+    """
+    Decodes the objects of a streamed JSON array one by one.
+    feed() takes text chunks as they arrive and returns the incidents whose
+    closing brace has been seen, so each can be acted on before the rest of
+    the response is generated. Only string and nesting state is tracked;
+    each complete object is decoded with json.loads.
+    """
+    def __init__(self):
+        self.text = []
+        self.complete = False  # the closing bracket of the array has been seen
+        self._buffer = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._object_start = None
+
+    def feed(self, chunk):
+        self.text.append(chunk)
+        self._buffer += chunk
+        incidents = []
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '[{':
+                self._depth += 1
+                if char == '{' and self._depth == 2:
+                    self._object_start = self._pos
+            elif char in ']}':
+                self._depth -= 1
+                if self._depth == 0:
+                    self.complete = True
+                elif char == '}' and self._depth == 1 and self._object_start is not None:
+                    try:
+                        incidents.append(json.loads(buffer[self._object_start:self._pos + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self._object_start = None
+            self._pos += 1
+
+        # Drop what has been consumed, keeping an unfinished object
+        keep = self._object_start if self._object_start is not None else self._pos
+        self._buffer = buffer[keep:]
+        self._pos -= keep
+        if self._object_start is not None:
+            self._object_start = 0
+        return incidents
+
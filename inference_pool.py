@@ -0,0 +1,207 @@
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+import cv2
+
+from model_registry import MODELS, DEFAULT_MODEL, download_model_files, resolve_input_size
+from yolo_detector import YOLODetection
+
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '0'))  # 0 or 1: a single in-process detector
+
+
+def available_cores():
+    """CPU cores this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def split_cores(cores, workers):
+    """Splits cores into `workers` contiguous groups; workers share all cores if there are fewer cores than workers."""
+    if workers > len(cores):
+        return [list(cores)] * workers
+    size, extra = divmod(len(cores), workers)
+    groups, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(list(cores[start:end]))
+        start = end
+    return groups
+
+
+def threads_per_worker(group, core_count, workers):
+    """
+    OpenCV threads for a worker with the cores in group (from split_cores): one
+    per core of its own, or an even share of core_count when workers share all cores.
+    """
+    return max(1, core_count // workers) if workers > core_count else len(group)
+
+
+def _worker_main(worker_id, model_name, model_spec, input_size, confidence_threshold, nms_threshold,
+                 cores, threads, requests, responses):
+    """Inference worker process: pins itself to its cores, loads its own network and serves batches."""
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    # OpenCV's own thread pool only gets this worker's share of the cores
+    cv2.setNumThreads(threads)
+
+    # Models registered at runtime only exist in the parent's catalogue
+    MODELS.setdefault(model_name, model_spec)
+    detector = YOLODetection(confidence_threshold, nms_threshold, model_name=model_name, input_size=input_size)
+    try:
+        detector.load_model()
+    except Exception as e:
+        responses.put(('ready', worker_id, RuntimeError(f"worker {worker_id} could not load {model_name}: {e}")))
+        return
+    responses.put(('ready', worker_id, None))
+
+    while True:
+        item = requests.get()
+        if item is None:
+            return
+        request_id, frames, sizes = item
+        try:
+            results = detector.detect_humans_batch_with_confidences(frames, sizes)
+            responses.put((request_id, worker_id, results))
+        except Exception as e:
+            responses.put((request_id, worker_id, RuntimeError(str(e))))
+
+
+class InferencePool:
+    """
+    A pool of inference worker processes, each with its own network, its
+    own share of the CPU cores (affinity + cv2.setNumThreads) and its own
+    request queue. Batches go to the worker with the fewest frames in flight.
+    Frames are resized to the network input before they are sent, so only
+    input_size x input_size images cross the process boundary.
+    """
+    def __init__(self, workers=None, model_name=None, input_size=None,
+                 confidence_threshold=0.5, nms_threshold=0.4):
+        self.workers = max(1, workers or INFERENCE_WORKERS or 1)
+        self.model_name = model_name or DEFAULT_MODEL
+        self.input_size = resolve_input_size(self.model_name, input_size)
+        self.confidence_threshold = confidence_threshold
+        self.nms_threshold = nms_threshold
+        cores = available_cores()
+        self.cores = split_cores(cores, self.workers)
+        self.threads = [threads_per_worker(group, len(cores), self.workers) for group in self.cores]
+        self.in_flight = [0] * self.workers
+        self.completed = [0] * self.workers
+        self.ready = threading.Event()
+        self.error = None
+        self._request_ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._context = multiprocessing.get_context('spawn')
+        self._responses = self._context.Queue()
+        self._queues = []
+        self._processes = []
+
+    def start(self, background=True):
+        """Downloads the model files once, then starts the workers (in the background by default)."""
+        if background:
+            threading.Thread(target=self._start, name='inference-pool-start', daemon=True).start()
+        else:
+            self._start()
+        return self
+
+    def _start(self):
+        try:
+            download_model_files(self.model_name)
+        except Exception as e:
+            self._fail(e)
+            return
+        for worker_id, (cores, threads) in enumerate(zip(self.cores, self.threads)):
+            requests = self._context.Queue()
+            process = self._context.Process(
+                target=_worker_main, name=f'inference-worker-{worker_id}', daemon=True,
+                args=(worker_id, self.model_name, MODELS[self.model_name], self.input_size,
+                      self.confidence_threshold, self.nms_threshold, cores, threads, requests, self._responses))
+            process.start()
+            self._queues.append(requests)
+            self._processes.append(process)
+        threading.Thread(target=self._collect, name='inference-pool-results', daemon=True).start()
+
+    def _fail(self, error):
+        print(f"✗ Inference pool failed: {error}")
+        self.error = error
+        self.ready.set()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future, _ in pending.values():
+            future.set_exception(RuntimeError(f"Inference pool is not available: {error}"))
+
+    def _collect(self):
+        """Resolves request futures with the results the workers send back."""
+        waiting = set(range(self.workers))
+        while True:
+            try:
+                request_id, worker_id, result = self._responses.get(timeout=1)
+            except queue.Empty:
+                dead = [i for i, process in enumerate(self._processes) if not process.is_alive()]
+                if dead:
+                    self._fail(RuntimeError(f"inference worker(s) {dead} exited"))
+                    return
+                continue
+            if request_id == 'ready':
+                if result is not None:
+                    self._fail(result)
+                    return
+                waiting.discard(worker_id)
+                if not waiting:
+                    print(f"✓ Inference pool ready: {self.workers} workers, cores {self.cores}")
+                    self.ready.set()
+                continue
+
+            with self._lock:
+                future, frames = self._pending.pop(request_id)
+                self.in_flight[worker_id] -= frames
+                self.completed[worker_id] += frames
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def submit_batch(self, frames):
+        """Sends frames to the least-loaded worker. Returns a Future for their (boxes, confidences) pairs."""
+        self.ready.wait()
+        if self.error is not None:
+            raise RuntimeError(f"Inference pool is not available: {self.error}")
+
+        size = (self.input_size, self.input_size)
+        resized = [cv2.resize(frame, size) for frame in frames]
+        sizes = [frame.shape[1::-1] for frame in frames]
+
+        future = Future()
+        with self._lock:
+            if self.error is not None:
+                raise RuntimeError(f"Inference pool is not available: {self.error}")
+            worker_id = min(range(self.workers), key=lambda i: self.in_flight[i])
+            request_id = next(self._request_ids)
+            self._pending[request_id] = (future, len(frames))
+            self.in_flight[worker_id] += len(frames)
+        self._queues[worker_id].put((request_id, resized, sizes))
+        return future
+
+    def detect_batch(self, frames):
+        """Blocking submit_batch(): one (boxes, confidences) pair per frame."""
+        return self.submit_batch(frames).result()
+
+    def stop(self):
+        for requests in self._queues:
+            requests.put(None)
+        for process in self._processes:
+            process.join(timeout=2)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ready': self.ready.is_set() and self.error is None,
+                'workers': [{'cores': cores, 'threads': threads, 'in_flight': in_flight, 'frames': completed}
+                            for cores, threads, in_flight, completed
+                            in zip(self.cores, self.threads, self.in_flight, self.completed)],
+            }
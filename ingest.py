@@ -0,0 +1,345 @@
+import hashlib
+import os
+import struct
+import threading
+import time
+import uuid
+
+import cv2
+from flask import Request
+from werkzeug.exceptions import NotFound, RequestEntityTooLarge, TooManyRequests
+
+PARTIAL_DIR_NAME = '.partial'
+MAX_MOOV_BYTES = 64 * 1024 * 1024  # larger metadata boxes are not buffered, cv2 probes the file instead
+RESUMABLE_IDLE_SECONDS = float(os.getenv('RESUMABLE_IDLE_SECONDS', '3600'))
+RESUMABLE_MAX_SESSIONS = int(os.getenv('RESUMABLE_MAX_SESSIONS', '64'))
+
+
+def _boxes(data, start, end):
+    """Yields (type, body_start, body_end) for the ISO-BMFF boxes in data[start:end]."""
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', data, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = struct.unpack_from('>Q', data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield kind, pos + header, pos + size
+        pos += size
+
+
+def _find(data, start, end, kind):
+    for box_kind, body_start, body_end in _boxes(data, start, end):
+        if box_kind == kind:
+            return body_start, body_end
+    return None
+
+
+class Mp4Probe:
+    """
+    Reads MP4/MOV container metadata from bytes as they arrive.
+    Media data (mdat) is skipped without buffering; only the moov box is
+    kept, and it is parsed as soon as it is complete, whether it sits at
+    the start (faststart) or the end of the file.
+    """
+    def __init__(self):
+        self.metadata = None
+        self.done = False
+        self._buffer = bytearray()
+        self._skip = 0
+
+    def feed(self, chunk):
+        if self.done:
+            return
+        chunk = memoryview(chunk)
+        if self._skip:
+            skipped = min(self._skip, len(chunk))
+            self._skip -= skipped
+            chunk = chunk[skipped:]
+        self._buffer += chunk
+
+        while not self.done and not self._skip and len(self._buffer) >= 8:
+            size, kind = struct.unpack_from('>I4s', self._buffer, 0)
+            if size == 1:
+                if len(self._buffer) < 16:
+                    return
+                size = struct.unpack_from('>Q', self._buffer, 8)[0]
+            if size == 0 or size < 8 or (kind == b'moov' and size > MAX_MOOV_BYTES):
+                # Box runs to the end of the file, is malformed or too large to hold
+                self._stop()
+                return
+
+            if kind == b'moov':
+                if len(self._buffer) < size:
+                    return
+                self.metadata = self._parse_moov(bytes(self._buffer[:size]))
+                self._stop()
+                return
+
+            if len(self._buffer) >= size:
+                del self._buffer[:size]
+            else:
+                self._skip = size - len(self._buffer)
+                self._buffer.clear()
+
+    def _stop(self):
+        self.done = True
+        self._buffer = bytearray()
+
+    @staticmethod
+    def _parse_moov(moov):
+        for kind, start, end in _boxes(moov, 8, len(moov)):
+            if kind != b'trak':
+                continue
+            mdia = _find(moov, start, end, b'mdia')
+            hdlr = mdia and _find(moov, *mdia, b'hdlr')
+            if not hdlr or moov[hdlr[0] + 8:hdlr[0] + 12] != b'vide':
+                continue
+
+            # Media timescale and duration
+            mdhd = _find(moov, *mdia, b'mdhd')
+            if not mdhd:
+                return None
+            if moov[mdhd[0]] == 1:
+                timescale, duration = struct.unpack_from('>IQ', moov, mdhd[0] + 20)
+            else:
+                timescale, duration = struct.unpack_from('>II', moov, mdhd[0] + 12)
+
+            # Sample (frame) count from the time-to-sample table
+            minf = _find(moov, *mdia, b'minf')
+            stbl = minf and _find(moov, *minf, b'stbl')
+            stts = stbl and _find(moov, *stbl, b'stts')
+            if not stts or not timescale or not duration:
+                return None
+            entries = struct.unpack_from('>I', moov, stts[0] + 4)[0]
+            frame_count = sum(struct.unpack_from('>I', moov, stts[0] + 8 + 8 * i)[0] for i in range(entries))
+
+            width = height = 0
+            tkhd = _find(moov, start, end, b'tkhd')
+            if tkhd:
+                offset = 88 if moov[tkhd[0]] == 1 else 76
+                width, height = (v >> 16 for v in struct.unpack_from('>II', moov, tkhd[0] + offset))
+
+            seconds = duration / timescale
+            if not frame_count:
+                return None
+            return {'fps': frame_count / seconds, 'frame_count': frame_count, 'duration': seconds,
+                    'width': width, 'height': height}
+        return None
+
+
+def probe_video(path):
+    """Container metadata read by OpenCV, for formats Mp4Probe does not understand."""
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            return None
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        return {'fps': fps, 'frame_count': frame_count, 'duration': frame_count / fps if fps > 0 else 0,
+                'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}
+    finally:
+        cap.release()
+
+
+class IngestedVideo:
+    """An upload that has landed on disk, with its content hash and container metadata."""
+    def __init__(self, path, size, sha256, metadata):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.metadata = metadata
+
+
+class IngestStream:
+    """
+    Writable file that hashes, size-checks and probes upload bytes while they
+    are written to a partial file. finish() moves the file into place.
+    """
+    def __init__(self, directory, max_bytes=None):
+        partial_dir = os.path.join(directory, PARTIAL_DIR_NAME)
+        os.makedirs(partial_dir, exist_ok=True)
+        self.path = os.path.join(partial_dir, f"{uuid.uuid4().hex}.part")
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.finished = False
+        self._file = open(self.path, 'w+b')
+        self._hash = hashlib.sha256()
+        self._probe = Mp4Probe()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            self.discard()
+            raise RequestEntityTooLarge(f"Upload exceeds {self.max_bytes // (1024 * 1024)} MB")
+        self._hash.update(data)
+        self._probe.feed(data)
+        return self._file.write(data)
+
+    # File methods the form parser and FileStorage rely on
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def readline(self, *args):
+        return self._file.readline(*args)
+
+    def close(self):
+        self._file.close()
+
+    def finish(self, final_path):
+        """Moves the upload to final_path and returns an IngestedVideo."""
+        self._file.close()
+        os.replace(self.path, final_path)
+        self.finished = True
+        metadata = self._probe.metadata or probe_video(final_path)
+        return IngestedVideo(final_path, self.size, self._hash.hexdigest(), metadata)
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class IngestRequest(Request):
+    """
+    Flask request whose file uploads go through IngestStream, so hashing,
+    probing and the size limit happen while the multipart body is parsed.
+    Partial files left by rejected or abandoned requests are removed on close.
+    """
+    upload_folder = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = IngestStream(self.upload_folder, self.max_content_length)
+        self.__dict__.setdefault('_ingest_streams', []).append(stream)
+        return stream
+
+    def close(self):
+        super().close()
+        for stream in self.__dict__.get('_ingest_streams', []):
+            if not stream.finished:
+                stream.discard()
+
+
+class ResumableUploads:
+    """
+    Chunked uploads that survive dropped connections: the client creates a
+    session, sends chunks at the offset the server reports, and resumes from
+    that offset after a failure. Sessions are kept in memory, at most
+    max_sessions at a time, and expire (with their partial file) after
+    idle_seconds without a chunk.
+    """
+    def __init__(self, directory, max_bytes=None, chunk_size=1024 * 1024,
+                 max_sessions=RESUMABLE_MAX_SESSIONS, idle_seconds=RESUMABLE_IDLE_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._remove_stale_partials()
+
+    def _remove_stale_partials(self):
+        """Removes partial files left by sessions of an earlier process."""
+        partial_dir = os.path.join(self.directory, PARTIAL_DIR_NAME)
+        if not os.path.isdir(partial_dir):
+            return
+        cutoff = time.time() - self.idle_seconds
+        for name in os.listdir(partial_dir):
+            path = os.path.join(partial_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def create(self, filename, size=None):
+        if size is not None and self.max_bytes is not None and size > self.max_bytes:
+            raise RequestEntityTooLarge(f"Upload exceeds {self.max_bytes // (1024 * 1024)} MB")
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._expire()
+            if len(self._sessions) >= self.max_sessions:
+                raise TooManyRequests("Too many uploads in progress, try again later")
+            self._sessions[upload_id] = {
+                'id': upload_id,
+                'stream': IngestStream(self.directory, self.max_bytes),
+                'filename': filename,
+                'size': size,
+                'lock': threading.Lock(),
+                'updated': time.time(),
+                'closed': False,
+            }
+        return upload_id
+
+    def get(self, upload_id):
+        with self._lock:
+            self._expire()
+            return self._sessions.get(upload_id)
+
+    def status(self, session):
+        return {'offset': session['stream'].size, 'size': session['size'], 'filename': session['filename']}
+
+    def append(self, session, offset, stream):
+        """
+        Appends a request body at offset. Returns the new offset, or None if offset is stale.
+        An upload that grows past max_bytes is dropped (RequestEntityTooLarge).
+        """
+        with session['lock']:
+            if session['closed']:
+                raise NotFound("Unknown or expired upload")
+            ingest = session['stream']
+            if offset != ingest.size:
+                return None
+            try:
+                for chunk in iter(lambda: stream.read(self.chunk_size), b''):
+                    ingest.write(chunk)
+            except RequestEntityTooLarge:
+                self._remove(session)
+                raise
+            session['updated'] = time.time()
+            return ingest.size
+
+    def finish(self, upload_id, final_path):
+        """Completes the upload. Returns an IngestedVideo, or None if bytes are missing."""
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None or (session['size'] is not None and session['stream'].size != session['size']):
+                return None
+            del self._sessions[upload_id]
+        with session['lock']:
+            session['closed'] = True
+            return session['stream'].finish(final_path)
+
+    def _remove(self, session):
+        """Drops a session and its partial file; the caller holds the session's lock."""
+        with self._lock:
+            self._sessions.pop(session['id'], None)
+        session['closed'] = True
+        session['stream'].discard()
+
+    def _expire(self):
+        """Drops sessions idle for longer than idle_seconds (not ones receiving a chunk right now)."""
+        now = time.time()
+        for upload_id, session in list(self._sessions.items()):
+            if now - session['updated'] > self.idle_seconds and session['lock'].acquire(blocking=False):
+                try:
+                    del self._sessions[upload_id]
+                    session['closed'] = True
+                    session['stream'].discard()
+                finally:
+                    session['lock'].release()
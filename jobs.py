@@ -0,0 +1,199 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOBS_DB_PATH = os.getenv('JOBS_DB_PATH', 'jobs.sqlite3')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+# A running job belongs to the process holding its lease; the lease is renewed while the job
+# runs, and a job whose lease ran out (its process died) is started again by another process
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '60'))
+# Finished and failed jobs are deleted this long after they ended
+JOB_RETENTION_SECONDS = float(os.getenv('JOB_RETENTION_SECONDS', str(7 * 24 * 3600)))
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+class JobProgress:
+    """
+    The progress(stage, **details) callback handed to a job handler.
+    state holds what the handler stored with save_state() during an earlier
+    run of the same job (before a restart), so a resumed job can skip side
+    effects it already had, such as alerts it already sent.
+    """
+    def __init__(self, manager, job_id, state):
+        self.manager = manager
+        self.job_id = job_id
+        self.state = state
+
+    def __call__(self, stage, **details):
+        self.manager._update_owned(self.job_id, stage=stage, details=json.dumps(details))
+
+    def save_state(self, **values):
+        self.state.update(values)
+        self.manager._update_owned(self.job_id, state=json.dumps(self.state))
+
+
+class JobManager:
+    """
+    Runs long analyses off the request thread.
+    submit() stores the job and returns its id straight away; a bounded pool
+    of workers runs the handler registered for the job's kind. Handlers get a
+    JobProgress callback. Jobs live in SQLite, so status and results outlive
+    the process, and several processes (e.g. WSGI workers) can share the table:
+    a job is claimed by one process at a time and held with a lease that a
+    background thread renews. resume() picks up queued jobs and running jobs
+    whose owner stopped renewing; the same thread also does this periodically
+    and deletes jobs that ended more than retention_seconds ago.
+    """
+    def __init__(self, path=JOBS_DB_PATH, workers=JOB_WORKERS, lease_seconds=JOB_LEASE_SECONDS,
+                 retention_seconds=JOB_RETENTION_SECONDS):
+        self.path = path
+        self.handlers = {}
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._maintenance = None
+        self._pending = set()  # ids waiting in this process's pool
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, stage TEXT,'
+                ' details TEXT, params TEXT NOT NULL, result TEXT, error TEXT,'
+                ' created_at REAL NOT NULL, updated_at REAL NOT NULL, state TEXT,'
+                ' owner TEXT, lease_until REAL)')
+            columns = [row[1] for row in self._db.execute('PRAGMA table_info(jobs)')]
+            for name, column_type in (('state', 'TEXT'), ('owner', 'TEXT'), ('lease_until', 'REAL')):
+                if name not in columns:
+                    self._db.execute(f'ALTER TABLE jobs ADD COLUMN {name} {column_type}')
+            self._db.execute('CREATE INDEX IF NOT EXISTS jobs_status_updated ON jobs (status, updated_at)')
+
+    def register(self, kind, handler):
+        """handler(params, progress) -> JSON-serialisable result."""
+        self.handlers[kind] = handler
+
+    def submit(self, kind, params):
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute('INSERT INTO jobs (id, kind, status, stage, params, created_at, updated_at) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (job_id, kind, QUEUED, QUEUED, json.dumps(params), now, now))
+        self._start_maintenance()
+        self._enqueue(job_id)
+        return job_id
+
+    def resume(self):
+        """
+        Queues jobs no live process is working on: queued ones, and running ones
+        whose lease expired (their process stopped). Returns how many.
+        """
+        self._start_maintenance()
+        return self._requeue_orphans()
+
+    def _requeue_orphans(self):
+        now = time.time()
+        with self._lock, self._db:
+            rows = self._db.execute(
+                'SELECT id, status FROM jobs WHERE status = ? OR (status = ? AND (lease_until IS NULL OR lease_until < ?))'
+                ' ORDER BY created_at', (QUEUED, RUNNING, now)).fetchall()
+            for job_id, status in rows:
+                if status == RUNNING:
+                    # Only if no one renewed the lease meanwhile
+                    self._db.execute('UPDATE jobs SET status = ?, stage = ?, owner = NULL, updated_at = ?'
+                                     ' WHERE id = ? AND status = ? AND (lease_until IS NULL OR lease_until < ?)',
+                                     (QUEUED, QUEUED, now, job_id, RUNNING, now))
+        # Queued jobs may also sit in another process's pool; whichever claims one first runs it
+        return sum(self._enqueue(job_id) for job_id, _ in rows)
+
+    def _enqueue(self, job_id):
+        """Adds a job to this process's pool unless it is already waiting there. True if added."""
+        with self._lock:
+            if job_id in self._pending:
+                return False
+            self._pending.add(job_id)
+        self._executor.submit(self._run, job_id)
+        return True
+
+    def _start_maintenance(self):
+        with self._lock:
+            if self._maintenance is not None:
+                return
+            self._maintenance = threading.Thread(target=self._maintain, name='job-leases', daemon=True)
+        self._maintenance.start()
+
+    def _maintain(self):
+        """Renews this process's leases, picks up orphaned jobs and prunes old ones."""
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            try:
+                now = time.time()
+                with self._lock, self._db:
+                    self._db.execute('UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = ?',
+                                     (now + self.lease_seconds, self.owner, RUNNING))
+                    self._db.execute('DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?',
+                                     (DONE, FAILED, now - self.retention_seconds))
+                requeued = self._requeue_orphans()
+                if requeued:
+                    print(f"Requeued {requeued} analysis jobs")
+            except sqlite3.Error as e:
+                print(f"WARNING: Could not maintain job leases: {e}")
+
+    def get(self, job_id):
+        """The job as a dict (without its params), or None."""
+        with self._lock:
+            row = self._db.execute('SELECT id, kind, status, stage, details, result, error, created_at, updated_at '
+                                   'FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        keys = ('id', 'kind', 'status', 'stage', 'details', 'result', 'error', 'created_at', 'updated_at')
+        job = dict(zip(keys, row))
+        job['details'] = json.loads(job['details']) if job['details'] else {}
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def _claim(self, job_id):
+        """Atomically takes a queued job for this process. False if another process got it first."""
+        now = time.time()
+        with self._lock, self._db:
+            claimed = self._db.execute(
+                'UPDATE jobs SET status = ?, stage = ?, owner = ?, lease_until = ?, updated_at = ?'
+                ' WHERE id = ? AND status = ?',
+                (RUNNING, 'starting', self.owner, now + self.lease_seconds, now, job_id, QUEUED)).rowcount
+        return claimed == 1
+
+    def _update_owned(self, job_id, **fields):
+        """Updates a job this process runs; ignored if the job was taken over after losing its lease."""
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with self._lock, self._db:
+            self._db.execute(f'UPDATE jobs SET {assignments} WHERE id = ? AND owner = ?',
+                             (*fields.values(), job_id, self.owner))
+
+    def _run(self, job_id):
+        with self._lock:
+            self._pending.discard(job_id)
+        if not self._claim(job_id):
+            return
+        with self._lock:
+            row = self._db.execute('SELECT kind, params, state FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        kind, params = row[0], json.loads(row[1])
+        progress = JobProgress(self, job_id, json.loads(row[2]) if row[2] else {})
+
+        try:
+            result = self.handlers[kind](params, progress)
+        except Exception as e:
+            traceback.print_exc()
+            self._update_owned(job_id, status=FAILED, stage=FAILED, error=str(e))
+            return
+        self._update_owned(job_id, status=DONE, stage=DONE, result=json.dumps(result))
@@ -0,0 +1,99 @@
+import os
+
+import cv2
+
+from media_tools import ANALYSIS_PROXY_SIZE
+from motion_gate import MotionGate
+
+# Keyframe mode: a clip is sent to Gemini as a few inline JPEG frames instead of an uploaded video,
+# which skips the File API upload and the PROCESSING wait
+KEYFRAME_COUNT = int(os.getenv('KEYFRAME_COUNT', '8'))
+KEYFRAME_SELECTION = os.getenv('KEYFRAME_SELECTION', 'motion')  # 'fixed' (evenly spaced) or 'motion'
+KEYFRAME_JPEG_QUALITY = 80
+# Frames between candidates from which seeking beats reading through: a seek decodes from the
+# previous keyframe of the stream, so it pays off once candidates are more than about a GOP apart
+KEYFRAME_SEEK_MIN_STEP = 250
+# Part of analysis cache keys
+KEYFRAME_VERSION = f"keyframes-{KEYFRAME_COUNT}-{KEYFRAME_SELECTION}-{ANALYSIS_PROXY_SIZE}p"
+
+
+class Keyframe:
+    """One sampled frame: its time in the clip and the encoded JPEG."""
+    def __init__(self, seconds, jpeg):
+        self.seconds = seconds
+        self.jpeg = jpeg
+
+    @property
+    def label(self):
+        minutes, seconds = divmod(self.seconds, 60)
+        return f"{int(minutes)}:{seconds:04.1f}"
+
+
+def _encode(frame, size):
+    """JPEG bytes of the frame with its short side scaled down to size."""
+    height, width = frame.shape[:2]
+    scale = size / min(height, width)
+    if scale < 1:
+        frame = cv2.resize(frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, KEYFRAME_JPEG_QUALITY])
+    return buffer.tobytes() if ok else None
+
+
+def extract_keyframes(video_path, count=KEYFRAME_COUNT, selection=KEYFRAME_SELECTION, size=ANALYSIS_PROXY_SIZE):
+    """
+    Picks up to `count` frames from a clip, in time order.
+    'fixed' spaces them evenly. 'motion' samples four candidates per keyframe
+    and keeps the first frame plus the candidates that changed most since the
+    previous candidate, so the frames follow the action.
+    Returns a list of Keyframe (empty if the clip could not be read).
+    """
+    if selection not in ('fixed', 'motion'):
+        raise ValueError(f"Unknown keyframe selection '{selection}', use 'fixed' or 'motion'")
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            return []
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        candidates = count if selection == 'fixed' else count * 4
+        step = max(1, -(-frame_count // candidates)) if frame_count > 0 else max(1, round(fps))
+
+        gate = MotionGate()
+        sampled = []  # (motion, seconds, keyframe), encoded straight away so full frames are not held
+
+        def sample(frame_index, frame):
+            fraction, gray = gate.changed_fraction(frame)
+            gate.reference = gray
+            jpeg = _encode(frame, size)
+            if jpeg:
+                sampled.append((fraction, frame_index / fps, Keyframe(frame_index / fps, jpeg)))
+
+        if frame_count > 0 and step >= KEYFRAME_SEEK_MIN_STEP:
+            for frame_index in range(0, frame_count, step):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                sample(frame_index, frame)
+        else:
+            frame_index = 0
+            # grab() still demuxes and decodes every frame; only candidates pay for retrieve()'s
+            # conversion to BGR and the motion/JPEG work
+            while cap.grab():
+                if frame_index % step == 0:
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        break
+                    sample(frame_index, frame)
+                frame_index += 1
+    finally:
+        cap.release()
+
+    if selection == 'motion' and len(sampled) > count:
+        # The first candidate has nothing to compare with (fraction 1.0), so it is always kept
+        sampled = sorted(sampled, key=lambda s: s[0], reverse=True)[:count]
+        sampled.sort(key=lambda s: s[1])
+    elif len(sampled) > count:
+        # Frame count was unknown: spread the picks over what was sampled
+        sampled = [sampled[i * (len(sampled) - 1) // (count - 1)] for i in range(count)] if count > 1 else sampled[:1]
+    return [keyframe for _, _, keyframe in sampled]
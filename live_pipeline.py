@@ -0,0 +1,228 @@
+import cv2
+import queue
+import threading
+import time
+from adaptive_stride import AdaptiveStride
+from motion_gate import MotionGate
+from tracker import SortTracker
+
+
+class StageTimer:
+    """Running timing statistics for one pipeline stage."""
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.last = seconds
+            self.max = max(self.max, seconds)
+
+    def summary(self):
+        with self._lock:
+            return {
+                'frames': self.count,
+                'avg_ms': round(self.total / self.count * 1000, 1) if self.count else 0.0,
+                'max_ms': round(self.max * 1000, 1),
+                'last_ms': round(self.last * 1000, 1),
+            }
+
+
+class LatestFrame:
+    """
+    Single-slot mailbox between capture and inference.
+    put() replaces a frame that has not been taken yet, so inference always
+    works on the newest frame instead of a backlog of stale ones.
+    """
+    def __init__(self):
+        self._item = None
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        with self._cond:
+            if self._item is None:
+                self._cond.wait(timeout)
+            item, self._item = self._item, None
+            return item
+
+
+def put_drop_oldest(q, item):
+    """Puts into a bounded queue, discarding the oldest entry when it is full. Returns True if one was dropped."""
+    while True:
+        try:
+            q.put_nowait(item)
+            return False
+        except queue.Full:
+            try:
+                q.get_nowait()
+                return True
+            except queue.Empty:
+                pass
+
+
+class LivePipeline:
+    """
+    Capture, inference and output stages for live detection, each on its own thread.
+
+    - capture: reads frames, hands the newest one to inference and every frame
+      to the output queue (bounded; the oldest frame is dropped if output falls behind)
+    - inference: adaptive stride + motion gate + YOLO + tracker on the newest frame,
+      publishes a snapshot of the tracks
+    - output: the caller iterates frames() and gets each frame with the latest tracks
+
+    OpenCV releases the GIL in read/forward/write, so the stages overlap for real.
+    File sources are not dropped: capture waits for inference instead.
+    """
+    def __init__(self, detector, source=0, min_stride=1, max_stride=6, motion_threshold=0.005,
+                 output_queue_size=8, report_interval=10):
+        self.detector = detector
+        self.source = source
+        self.realtime = not (isinstance(source, str) and '://' not in source)
+        self.stride = AdaptiveStride(min_stride, max_stride)
+        self.tracker = SortTracker()
+        self.motion_gate = MotionGate(threshold=motion_threshold) if motion_threshold else None
+        self.report_interval = report_interval
+
+        self.latest_frame = LatestFrame()
+        self.output_queue = queue.Queue(maxsize=output_queue_size)
+        self.output_dropped = 0
+        self.stop_event = threading.Event()
+        self.capture_done = threading.Event()
+
+        self.timers = {name: StageTimer(name) for name in ('capture', 'inference', 'output', 'latency')}
+        self._tracks = []
+        self._tracks_lock = threading.Lock()
+        self._inference_idle = threading.Event()
+        self._inference_idle.set()
+        self._threads = []
+
+        self.cap = cv2.VideoCapture(source)
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = int(self.cap.get(cv2.CAP_PROP_FPS)) or 30
+
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    def start(self):
+        for name, target in (('capture', self._capture_loop), ('inference', self._inference_loop)):
+            thread = threading.Thread(target=target, name=f'live-{name}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self.stop_event.set()
+        self._inference_idle.set()
+        self.latest_frame.put(None)
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self.cap.release()
+
+    def tracks(self):
+        """Latest tracks as (track_id, box, confidence) tuples."""
+        with self._tracks_lock:
+            return list(self._tracks)
+
+    def _capture_loop(self):
+        while not self.stop_event.is_set():
+            start = time.perf_counter()
+            ret, frame = self.cap.read()
+            if not ret:
+                print("End of video or failed to read frame")
+                break
+            captured_at = time.perf_counter()
+            self.timers['capture'].add(captured_at - start)
+
+            if not self.realtime:
+                # Files: keep every frame, wait for inference to catch up
+                self._inference_idle.wait()
+                self._inference_idle.clear()
+            self.latest_frame.put((frame, captured_at))
+            if self.realtime:
+                if put_drop_oldest(self.output_queue, (frame, captured_at)):
+                    self.output_dropped += 1
+            else:
+                self._put_blocking((frame, captured_at))
+
+        if not self.realtime:
+            self._inference_idle.wait(timeout=5)
+        self.capture_done.set()
+        self.latest_frame.put(None)
+
+    def _put_blocking(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.output_queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _inference_loop(self):
+        while not self.stop_event.is_set():
+            item = self.latest_frame.get(timeout=0.5)
+            if item is None:
+                if self.capture_done.is_set():
+                    break
+                continue
+            frame, captured_at = item
+
+            start = time.perf_counter()
+            if self.stride.should_detect():
+                if self.motion_gate is None or self.motion_gate.should_infer(frame):
+                    boxes, confidences = self.detector.detect_humans(frame)
+                    self.stride.update(len(boxes))
+                    tracks = self.tracker.update(boxes, confidences)
+                else:
+                    # Nothing moved: coast the tracks, so people who left expire
+                    tracks = self.tracker.step()
+            else:
+                tracks = self.tracker.step()
+            done = time.perf_counter()
+
+            with self._tracks_lock:
+                self._tracks = [(t.id, t.box, t.confidence) for t in tracks]
+            self.timers['inference'].add(done - start)
+            self.timers['latency'].add(done - captured_at)
+            self._inference_idle.set()
+
+    def frames(self):
+        """Output stage: yields (frame, tracks) until capture ends or stop() is called."""
+        last_report = time.time()
+        while not self.stop_event.is_set():
+            try:
+                frame, _ = self.output_queue.get(timeout=0.5)
+            except queue.Empty:
+                if self.capture_done.is_set():
+                    break
+                continue
+
+            start = time.perf_counter()
+            tracks = self.tracks()
+            yield frame, tracks
+            self.timers['output'].add(time.perf_counter() - start)
+
+            if self.report_interval and time.time() - last_report >= self.report_interval:
+                print(f"Pipeline timings: {self.report()}")
+                last_report = time.time()
+
+    def report(self):
+        """Per-stage timing and drop counters."""
+        stats = {name: timer.summary() for name, timer in self.timers.items()}
+        stats['dropped'] = {'inference': self.latest_frame.dropped, 'output': self.output_dropped}
+        if self.motion_gate is not None:
+            stats['motion_gate'] = self.motion_gate.stats()
+        return stats
@@ -1,24 +1,40 @@
+import argparse
 from yolo_detection import YOLODetection
+from multi_camera import MultiCameraSupervisor, parse_source
 from config import GEMINI_API_KEY
 
 
 def main():
     # for testing
-    #  VIDEO_FILE_PATH = "path to video" 
-    
+    #  python main.py --source "path to video" --source rtsp://camera2/stream
+    parser = argparse.ArgumentParser(description='WatchTower live monitoring')
+    parser.add_argument('--source', action='append',
+                        help='Camera index, video file or stream URL (repeat for several cameras, default: 0)')
+    parser.add_argument('--model', type=str, default=None, help='Detector model, e.g. yolov4-tiny')
+    parser.add_argument('--input-size', type=int, default=None, help='Detector input size (320/416/608)')
+    args = parser.parse_args()
+    sources = args.source or ['0']
+
     # Initialize detector
     detector = YOLODetection(
         confidence_threshold=0.5,
         nms_threshold=0.4,
-        gemini_api_key=GEMINI_API_KEY
+        gemini_api_key=GEMINI_API_KEY,
+        model_name=args.model,
+        input_size=args.input_size
     )
-    # Run detection on video file
-    detector.run_detection(source=0, save_video=False)
-    
+
+    if len(sources) == 1:
+        # Capture, inference and display run on separate threads
+        detector.run_pipelined_detection(source=parse_source(sources[0]), save_video=False)
+    else:
+        # One capture thread per camera, batched inference shared by all of them
+        MultiCameraSupervisor(detector, sources).run()
+
 if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt:
         print("WatchTower Stopped")
     except Exception as e:
-        print(f"\n❌ Error: {e}")
\ No newline at end of file
+        print(f"\n❌ Error: {e}")
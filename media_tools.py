@@ -0,0 +1,209 @@
+import csv
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+
+import cv2
+
+# Analysis proxy: the smaller copy of a video that is uploaded to Gemini in place of the original.
+# Frames are resampled in time and scaled, never cut, so timestamps in the proxy match the original.
+ANALYSIS_PROXY_ENABLED = os.getenv('ANALYSIS_PROXY', '1') != '0'
+ANALYSIS_PROXY_SIZE = int(os.getenv('ANALYSIS_PROXY_SIZE', '480'))  # short side in pixels, never upscaled
+ANALYSIS_PROXY_FPS = float(os.getenv('ANALYSIS_PROXY_FPS', '5'))
+ANALYSIS_PROXY_BITRATE = os.getenv('ANALYSIS_PROXY_BITRATE', '400k')
+# Part of analysis cache keys: results from different profiles are not interchangeable
+ANALYSIS_PROXY_VERSION = (
+    f"proxy-{ANALYSIS_PROXY_SIZE}p{ANALYSIS_PROXY_FPS:g}fps{ANALYSIS_PROXY_BITRATE}"
+    if ANALYSIS_PROXY_ENABLED else "original"
+)
+# Transcodes may run this long, or FFMPEG_TIMEOUT_PER_VIDEO_SECOND per second of video if that is longer
+FFMPEG_TIMEOUT_SECONDS = float(os.getenv('FFMPEG_TIMEOUT_SECONDS', '600'))
+FFMPEG_TIMEOUT_PER_VIDEO_SECOND = float(os.getenv('FFMPEG_TIMEOUT_PER_VIDEO_SECOND', '2'))
+
+
+def find_ffmpeg():
+    """Returns the ffmpeg executable: the system one, or the binary bundled with moviepy (imageio-ffmpeg)."""
+    path = shutil.which('ffmpeg')
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return None
+
+
+def ffmpeg_timeout(duration):
+    """Timeout for transcoding `duration` seconds of video."""
+    return max(FFMPEG_TIMEOUT_SECONDS, (duration or 0) * FFMPEG_TIMEOUT_PER_VIDEO_SECOND)
+
+
+def video_duration(video_path):
+    """Duration in seconds from the container's frame count and fps, or 0 if unknown."""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        return frames / fps if fps > 0 and frames > 0 else 0
+    finally:
+        cap.release()
+
+
+def run_ffmpeg(args, timeout=FFMPEG_TIMEOUT_SECONDS):
+    """Runs ffmpeg with the given arguments. Returns True on success."""
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        return False
+    try:
+        result = subprocess.run([ffmpeg, '-hide_banner', '-loglevel', 'error', '-y'] + args,
+                                capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        print(f"✗ ffmpeg timed out after {timeout:.0f}s (see FFMPEG_TIMEOUT_SECONDS / FFMPEG_TIMEOUT_PER_VIDEO_SECOND)")
+        return False
+    if result.returncode != 0:
+        print(f"✗ ffmpeg failed: {result.stderr.strip()[:500]}")
+        return False
+    return True
+
+
+def iter_segment_stream_copy(video_path, output_dir, segment_seconds, name, poll_seconds=0.2):
+    """
+    Cuts a video into ~segment_seconds pieces without re-encoding (ffmpeg segment muxer)
+    and yields (clip_path, start_seconds, end_seconds) for each piece as soon as ffmpeg
+    closes it, so the caller can work on early clips while later ones are being cut.
+    Cuts land on keyframes, so segments can be slightly longer than requested.
+    Returns (StopIteration value) True if the whole video was cut, False if ffmpeg is
+    unavailable or failed; segment files that were not yielded are deleted either way.
+    The caller owns the yielded files.
+    """
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        return False
+    segment_list = os.path.join(output_dir, f"{name}_segments.csv")
+    segment_name = re.compile(re.escape(name) + r'_clip_\d+\.mp4$')
+    handed_out = set()
+    with open(segment_list, 'w'):
+        pass  # ffmpeg appends one row per finished segment
+    with tempfile.TemporaryFile(mode='w+') as errors:
+        process = subprocess.Popen([
+            ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+            '-i', video_path, '-map', '0:v:0', '-c', 'copy',
+            '-f', 'segment', '-segment_time', str(segment_seconds), '-reset_timestamps', '1',
+            '-segment_list', segment_list, '-segment_list_type', 'csv',
+            os.path.join(output_dir, f"{name}_clip_%d.mp4"),
+        ], stdout=subprocess.DEVNULL, stderr=errors)
+        try:
+            with open(segment_list, newline='') as listing:
+                pending = ''
+                while True:
+                    finished = process.poll() is not None
+                    # Only complete rows: ffmpeg may be half way through writing the next one
+                    pending += listing.read()
+                    *rows, pending = pending.split('\n')
+                    for row in csv.reader(rows):
+                        if len(row) >= 3:
+                            clip_path = os.path.join(output_dir, row[0])
+                            handed_out.add(clip_path)
+                            yield clip_path, float(row[1]), float(row[2])
+                    if finished:
+                        break
+                    time.sleep(poll_seconds)
+            if process.returncode != 0:
+                errors.seek(0)
+                print(f"✗ ffmpeg failed: {errors.read().strip()[:500]}")
+                return False
+            return True
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            os.remove(segment_list)
+            # Segments the caller never got: cut after it stopped, or left by a failed run
+            for entry in os.listdir(output_dir):
+                path = os.path.join(output_dir, entry)
+                if segment_name.match(entry) and path not in handed_out:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+
+# Encoder settings shared by proxies and highlight reels
+_PROXY_CODEC_ARGS = [
+    '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+    '-b:v', ANALYSIS_PROXY_BITRATE, '-maxrate', ANALYSIS_PROXY_BITRATE, '-bufsize', ANALYSIS_PROXY_BITRATE,
+    '-c:a', 'aac', '-b:a', '32k', '-ac', '1',
+    '-movflags', '+faststart',
+]
+
+
+def _proxy_filters():
+    """Video filters of the proxy profile: constant ANALYSIS_PROXY_FPS, short side scaled down to ANALYSIS_PROXY_SIZE."""
+    size = ANALYSIS_PROXY_SIZE
+    # Works for landscape and portrait, keeps the aspect ratio and even dimensions
+    scale = f"scale='if(gt(iw,ih),-2,min(iw,{size}))':'if(gt(iw,ih),min(ih,{size}),-2)'"
+    return [f"fps={ANALYSIS_PROXY_FPS:g}", scale]
+
+
+def make_analysis_proxy(video_path, output_path=None, duration=None):
+    """
+    Transcodes a video to the analysis proxy profile (H.264, ANALYSIS_PROXY_SIZE
+    short side, ANALYSIS_PROXY_FPS, ANALYSIS_PROXY_BITRATE, mono audio).
+    Returns the proxy path, or None if proxies are disabled, ffmpeg is
+    unavailable, fails or times out (the timeout grows with duration, read from
+    the file if not given), or the proxy would not be smaller than the original.
+    The caller owns (and deletes) the proxy file.
+    """
+    if not ANALYSIS_PROXY_ENABLED:
+        return None
+    if output_path is None:
+        temp_file = tempfile.NamedTemporaryFile(suffix='_proxy.mp4', delete=False)
+        temp_file.close()
+        output_path = temp_file.name
+
+    if duration is None:
+        duration = video_duration(video_path)
+    ok = run_ffmpeg([
+        '-i', video_path, '-map', '0:v:0', '-map', '0:a:0?',
+        '-vf', ','.join(_proxy_filters()),
+        *_PROXY_CODEC_ARGS,
+        output_path,
+    ], timeout=ffmpeg_timeout(duration))
+    original_size = os.path.getsize(video_path)
+    if not ok or not os.path.exists(output_path) or os.path.getsize(output_path) >= original_size:
+        if ok:
+            print("Analysis proxy skipped: not smaller than the original")
+        else:
+            print(f"⚠️ Analysis proxy skipped (ffmpeg failed or timed out), uploading the "
+                  f"{original_size / (1024 * 1024):.1f} MB original instead")
+        try:
+            os.remove(output_path)
+        except OSError:
+            pass
+        return None
+
+    print(f"Analysis proxy: {original_size / (1024 * 1024):.1f} MB -> "
+          f"{os.path.getsize(output_path) / (1024 * 1024):.1f} MB ({ANALYSIS_PROXY_VERSION})")
+    return output_path
+
+
+def concat_intervals(video_path, intervals, output_path):
+    """
+    Encodes the [(start, end)] second intervals of a video back to back into
+    output_path, with the analysis proxy profile. Returns True on success.
+    """
+    selection = '+'.join(f"gte(t,{start:.3f})*lt(t,{end:.3f})" for start, end in intervals)
+    fps, scale = _proxy_filters()
+    # fps first: the selected frames are then evenly spaced and can be renumbered without gaps
+    video_filter = f"{fps},select='{selection}',setpts=N/FRAME_RATE/TB,{scale}"
+    audio_filter = f"aselect='{selection}',asetpts=N/SR/TB"
+    # The whole input up to the last interval is decoded
+    return run_ffmpeg([
+        '-i', video_path, '-map', '0:v:0', '-map', '0:a:0?',
+        '-vf', video_filter, '-af', audio_filter, '-r', f"{ANALYSIS_PROXY_FPS:g}",
+        *_PROXY_CODEC_ARGS,
+        output_path,
+    ], timeout=ffmpeg_timeout(intervals[-1][1] if intervals else 0))
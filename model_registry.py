@@ -0,0 +1,267 @@
+import cv2
+import numpy as np
+import urllib.request
+import argparse
+import json
+import os
+import threading
+import time
+from yolo_postprocess import YOLOPostprocessor
+
+CLASS_NAMES = ('coco.names', 'https://raw.githubusercontent.com/AlexeyAB/darknet/master/data/coco.names')
+
+# Model catalogue. Files are downloaded on first use if they are not present.
+# `cpu_latency_ms` maps input size -> measured forward pass time, filled in by
+# benchmark_model() and persisted in PROFILE_PATH.
+MODELS = {
+    'yolov4': {
+        'weights': ('yolov4.weights', 'https://github.com/AlexeyAB/darknet/releases/download/darknet_yolo_v3_optimal/yolov4.weights'),
+        'cfg': ('yolov4.cfg', 'https://raw.githubusercontent.com/AlexeyAB/darknet/master/cfg/yolov4.cfg'),
+        'names': CLASS_NAMES,
+        'input_size': 416,
+        'cpu_latency_ms': {},
+    },
+    'yolov4-tiny': {
+        'weights': ('yolov4-tiny.weights', 'https://github.com/AlexeyAB/darknet/releases/download/darknet_yolo_v4_pre/yolov4-tiny.weights'),
+        'cfg': ('yolov4-tiny.cfg', 'https://raw.githubusercontent.com/AlexeyAB/darknet/master/cfg/yolov4-tiny.cfg'),
+        'names': CLASS_NAMES,
+        'input_size': 416,
+        'cpu_latency_ms': {},
+    },
+}
+
+# Standard darknet input resolutions. Any multiple of 32 works.
+INPUT_SIZES = (320, 416, 608)
+
+# Deployment defaults, overridable per detector / camera
+DEFAULT_MODEL = os.getenv('YOLO_MODEL', 'yolov4')
+
+
+def _env_input_size():
+    """YOLO_INPUT_SIZE from the environment; empty or unset means the model default (None)."""
+    value = (os.getenv('YOLO_INPUT_SIZE') or '').strip()
+    if not value:
+        return None
+    try:
+        return int(value) or None
+    except ValueError:
+        raise ValueError(f"YOLO_INPUT_SIZE must be a whole number such as 416 (or empty), got '{value}'") from None
+
+
+DEFAULT_INPUT_SIZE = _env_input_size()
+
+PROFILE_PATH = os.getenv('YOLO_PROFILE_PATH', 'model_profile.json')
+
+_models = {}
+_registry_lock = threading.Lock()
+
+
+def download_file(filename, url):
+    """Downloads a model file if it does not exist yet."""
+    if os.path.exists(filename):
+        return
+    if not url:
+        raise FileNotFoundError(f"Model file {filename} not found")
+    print(f"Downloading {filename}...")
+    try:
+        urllib.request.urlretrieve(url, filename)
+        print(f"✓ Downloaded {filename} successfully.")
+    except Exception as e:
+        print(f"✗ Error downloading {filename}: {e}")
+        raise
+
+
+def download_model_files(name):
+    """Makes sure a catalogue entry's weights, cfg and names files are on disk. Returns the entry."""
+    files = MODELS[name]
+    for filename, url in (files['weights'], files['cfg'], files['names']):
+        download_file(filename, url)
+    return files
+
+
+def register_model(name, cfg_path, weights_path, names_path=CLASS_NAMES[0], input_size=416):
+    """Adds a local darknet cfg/weights pair to the catalogue."""
+    MODELS[name] = {
+        'weights': (weights_path, None),
+        'cfg': (cfg_path, None),
+        'names': (names_path, CLASS_NAMES[1] if names_path == CLASS_NAMES[0] else None),
+        'input_size': check_input_size(input_size),
+        'cpu_latency_ms': {},
+    }
+    _apply_profile(name)
+
+
+def resolve_input_size(name, input_size=None):
+    """Picks the input size for a model: explicit value, deployment default, then the catalogue default."""
+    return check_input_size(input_size or DEFAULT_INPUT_SIZE or MODELS[name]['input_size'])
+
+
+def check_input_size(size):
+    """Darknet networks accept any square input that is a multiple of 32."""
+    if size <= 0 or size % 32 != 0:
+        raise ValueError(f"YOLO input size must be a multiple of 32 (e.g. {INPUT_SIZES}), got {size}")
+    return size
+
+
+class SharedModel:
+    """
+    A YOLO network that is loaded once per process and shared by every detector.
+    cv2.dnn.Net is not thread safe, so callers must hold `lock` around
+    setInput/forward and while reading the output buffers.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.net = None
+        self.output_layers = None
+        self.classes = None
+        self.person_class_id = 0
+        self._load_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.net is not None
+
+    def load(self):
+        """Loads the network on first call; later calls return immediately."""
+        if self.net is not None:
+            return self
+
+        with self._load_lock:
+            if self.net is not None:
+                return self
+
+            files = download_model_files(self.name)
+
+            with open(files['names'][0], 'r') as f:
+                self.classes = [line.strip() for line in f.readlines()]
+            if "person" in self.classes:
+                self.person_class_id = self.classes.index("person")
+
+            try:
+                net = cv2.dnn.readNet(files['weights'][0], files['cfg'][0])
+                layer_names = net.getLayerNames()
+                # Note: The way to get output layers can vary between OpenCV versions
+                self.output_layers = [layer_names[i - 1] for i in net.getUnconnectedOutLayers()]
+            except Exception as e:
+                print(f"✗ Error loading YOLO model {self.name}: {e}")
+                raise
+            self.net = net
+            print(f"✓ YOLO model {self.name} loaded successfully.")
+        return self
+
+
+def get_model(name=None):
+    """Returns the shared handle for a model. The weights are loaded lazily by SharedModel.load()."""
+    name = name or DEFAULT_MODEL
+    if name not in MODELS:
+        raise ValueError(f"Unknown YOLO model '{name}'. Available: {', '.join(MODELS)}")
+    with _registry_lock:
+        if name not in _models:
+            _models[name] = SharedModel(name)
+        return _models[name]
+
+
+def warm_up(names=None, background=True):
+    """Loads the given models ahead of the first request, by default in a daemon thread."""
+    names = names or [DEFAULT_MODEL]
+
+    def load_all():
+        for name in names:
+            try:
+                get_model(name).load()
+            except Exception as e:
+                print(f"✗ Warm-up failed for {name}: {e}")
+
+    if not background:
+        load_all()
+        return None
+
+    thread = threading.Thread(target=load_all, name='yolo-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def _load_profile():
+    if not os.path.exists(PROFILE_PATH):
+        return {}
+    try:
+        with open(PROFILE_PATH, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"✗ Error reading model profile {PROFILE_PATH}: {e}")
+        return {}
+
+
+def _apply_profile(name):
+    """Copies previously measured latencies for a model into the catalogue."""
+    measured = _load_profile().get(name, {})
+    MODELS[name]['cpu_latency_ms'].update({int(size): ms for size, ms in measured.items()})
+
+
+def benchmark_model(name, input_size=None, runs=20):
+    """
+    Measures the median CPU forward pass time of a model at an input size,
+    records it in the catalogue and saves it to PROFILE_PATH.
+    """
+    input_size = resolve_input_size(name, input_size)
+    model = get_model(name).load()
+    postprocessor = YOLOPostprocessor(input_size=input_size, class_id=model.person_class_id)
+    frame = np.random.randint(0, 255, (720, 1280, 3), dtype=np.uint8)
+
+    timings = []
+    with model.lock:
+        postprocessor.forward(model.net, model.output_layers, [frame])  # first pass allocates
+        for _ in range(runs):
+            start = time.perf_counter()
+            postprocessor.forward(model.net, model.output_layers, [frame])
+            timings.append((time.perf_counter() - start) * 1000)
+
+    latency = round(float(np.median(timings)), 1)
+    MODELS[name]['cpu_latency_ms'][input_size] = latency
+
+    profile = _load_profile()
+    profile.setdefault(name, {})[str(input_size)] = latency
+    with open(PROFILE_PATH, 'w') as f:
+        json.dump(profile, f, indent=2)
+    return latency
+
+
+def describe_models():
+    """Returns the catalogue with the measured latencies, for logs and status pages."""
+    return [
+        {
+            'name': name,
+            'input_size': entry['input_size'],
+            'cpu_latency_ms': dict(entry['cpu_latency_ms']),
+            'loaded': name in _models and _models[name].loaded,
+        }
+        for name, entry in MODELS.items()
+    ]
+
+
+for _name in MODELS:
+    _apply_profile(_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='YOLO model catalogue and CPU latency profiler')
+    parser.add_argument('--benchmark', type=str, choices=list(MODELS),
+                        help='Model to benchmark')
+    parser.add_argument('--input-size', type=int, action='append',
+                        help='Input size to benchmark (repeatable, default: 320, 416 and 608)')
+    parser.add_argument('--runs', type=int, default=20, help='Timed forward passes per size')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for size in args.input_size or INPUT_SIZES:
+            latency = benchmark_model(args.benchmark, size, args.runs)
+            print(f"{args.benchmark} @ {size}x{size}: {latency} ms")
+
+    for entry in describe_models():
+        latencies = ', '.join(f"{size}: {ms} ms" for size, ms in sorted(entry['cpu_latency_ms'].items())) or 'not measured'
+        print(f"{entry['name']:<14} default input {entry['input_size']:<4} CPU latency: {latencies}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Cheap pre-check that decides whether a frame is worth running YOLO on.
+    Works on a small grayscale copy of the frame and measures the fraction of
+    pixels that changed since the last frame the detector saw ('diff'), or
+    the foreground fraction from an OpenCV background subtractor ('mog2').
+    """
+    def __init__(self, threshold=0.005, method='diff', width=160, pixel_threshold=25,
+                 refresh_interval=300):
+        if method not in ('diff', 'mog2'):
+            raise ValueError(f"Unknown motion gate method '{method}', use 'diff' or 'mog2'")
+        self.threshold = threshold  # fraction of the frame that must change
+        self.method = method
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.refresh_interval = refresh_interval  # force a detector run after this many skipped frames
+        self.reference = None
+        self.subtractor = cv2.createBackgroundSubtractorMOG2(detectShadows=False) if method == 'mog2' else None
+        self.last_changed_fraction = 0.0
+        self.frames_inferred = 0
+        self.frames_skipped = 0
+        self._skipped_in_a_row = 0
+
+    def _prepare(self, frame):
+        height, width = frame.shape[:2]
+        small = cv2.resize(frame, (self.width, max(1, int(height * self.width / width))),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def changed_fraction(self, frame):
+        """Fraction of the (downscaled) frame that changed."""
+        gray = self._prepare(frame)
+        if self.subtractor is not None:
+            mask = self.subtractor.apply(gray)
+            return float(np.count_nonzero(mask == 255)) / mask.size, gray
+
+        if self.reference is None or self.reference.shape != gray.shape:
+            return 1.0, gray
+        diff = cv2.absdiff(gray, self.reference)
+        return float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size, gray
+
+    def should_infer(self, frame):
+        """Returns True when the detector should run on this frame, and updates the counters."""
+        fraction, gray = self.changed_fraction(frame)
+        self.last_changed_fraction = fraction
+
+        if fraction >= self.threshold or self._skipped_in_a_row >= self.refresh_interval:
+            # Compare later frames against the frame the detector actually saw
+            self.reference = gray
+            self.frames_inferred += 1
+            self._skipped_in_a_row = 0
+            return True
+
+        self.frames_skipped += 1
+        self._skipped_in_a_row += 1
+        return False
+
+    def stats(self):
+        """Skip/infer counters for tuning the threshold per camera."""
+        total = self.frames_inferred + self.frames_skipped
+        return {
+            'method': self.method,
+            'threshold': self.threshold,
+            'frames_inferred': self.frames_inferred,
+            'frames_skipped': self.frames_skipped,
+            'skip_ratio': round(self.frames_skipped / total, 3) if total else 0.0,
+            'last_changed_fraction': round(self.last_changed_fraction, 4),
+        }
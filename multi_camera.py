@@ -0,0 +1,193 @@
+import cv2
+import threading
+import time
+from adaptive_stride import AdaptiveStride
+from live_pipeline import LatestFrame, StageTimer
+from motion_gate import MotionGate
+from recorder import ClipRecorder
+from tracker import SortTracker
+
+
+def parse_source(source):
+    """'0' -> 0 (webcam index), anything else is a file path or stream URL."""
+    return int(source) if isinstance(source, str) and source.isdigit() else source
+
+
+class Camera:
+    """Everything that is per camera: capture, detection schedule, tracks and the clip recorder."""
+    def __init__(self, name, source, recorder, min_stride=1, max_stride=6, motion_threshold=0.005):
+        self.name = name
+        self.source = parse_source(source)
+        self.is_file = isinstance(self.source, str) and '://' not in self.source
+        self.recorder = recorder
+        self.stride = AdaptiveStride(min_stride, max_stride)
+        self.motion_gate = MotionGate(threshold=motion_threshold) if motion_threshold else None
+        self.tracker = SortTracker()
+        self.latest = LatestFrame()
+        self.tracks = []
+        self.frames_read = 0
+        self.done = False
+        self.cap = None
+        self.open()
+
+    def open(self):
+        if self.cap is not None:
+            self.cap.release()
+        self.cap = cv2.VideoCapture(self.source)
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = int(self.cap.get(cv2.CAP_PROP_FPS)) or 30
+        return self.cap.isOpened()
+
+    def status(self):
+        stats = {
+            'source': str(self.source),
+            'frames_read': self.frames_read,
+            'people': len(self.tracks),
+            'stride': self.stride.stride,
+            'recording': self.recorder.is_recording,
+            'done': self.done,
+        }
+        if self.motion_gate is not None:
+            stats['motion_gate'] = self.motion_gate.stats()
+        return stats
+
+
+class MultiCameraSupervisor:
+    """
+    Monitors several cameras from one process.
+    Each camera has its own capture thread; a single inference thread
+    collects the newest frame from every camera that is due for detection
+    and runs them through the shared network in one batched forward pass.
+    Recording state and cooldowns are kept per camera.
+    """
+    def __init__(self, detector, sources, max_batch=8, min_stride=1, max_stride=6,
+                 motion_threshold=0.005, recording_duration=5, cooldown=2, reconnect_delay=2,
+                 report_interval=30):
+        self.detector = detector
+        self.max_batch = max_batch
+        self.reconnect_delay = reconnect_delay
+        self.report_interval = report_interval
+        self.cameras = []
+        for index, source in enumerate(sources):
+            recorder = ClipRecorder(duration=recording_duration, cooldown=cooldown,
+                                    on_finished=detector.analysis_queue.put)
+            camera = Camera(f"CAM{index + 1:02d}", source, recorder, min_stride, max_stride, motion_threshold)
+            if not camera.cap.isOpened():
+                print(f"Error: Could not open video source {source}")
+            self.cameras.append(camera)
+
+        self.frame_ready = threading.Event()
+        self.stop_event = threading.Event()
+        self.inference_timer = StageTimer('inference')
+        self.latency_timer = StageTimer('latency')
+        self.batch_sizes = {}
+        self._threads = []
+
+    def start(self):
+        for camera in self.cameras:
+            thread = threading.Thread(target=self._capture_loop, args=(camera,),
+                                      name=f'capture-{camera.name}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._inference_loop, name='shared-inference', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self):
+        self.stop_event.set()
+        self.frame_ready.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        for camera in self.cameras:
+            camera.recorder.stop()
+            camera.cap.release()
+
+    def run(self):
+        """Runs until every camera has finished (files) or Ctrl+C, then waits for pending analyses."""
+        self.start()
+        last_report = time.time()
+        try:
+            while not all(camera.done for camera in self.cameras):
+                time.sleep(0.5)
+                if self.report_interval and time.time() - last_report >= self.report_interval:
+                    print(f"Cameras: {self.status()}")
+                    last_report = time.time()
+        finally:
+            self.stop()
+            print(f"Cameras: {self.status()}")
+            print("Waiting for analysis to complete...")
+            self.detector.analysis_queue.join()
+
+    def _capture_loop(self, camera):
+        while not self.stop_event.is_set():
+            ret, frame = camera.cap.read()
+            if not ret:
+                if camera.is_file:
+                    print(f"{camera.name}: end of video")
+                    break
+                # Live source dropped: try to reconnect
+                print(f"{camera.name}: failed to read frame, reconnecting in {self.reconnect_delay}s")
+                camera.recorder.stop()
+                time.sleep(self.reconnect_delay)
+                camera.open()
+                continue
+
+            camera.frames_read += 1
+            # Every frame goes into the clip so recordings keep the source frame rate
+            camera.recorder.write(frame)
+            camera.latest.put((frame, time.perf_counter()))
+            self.frame_ready.set()
+
+            if camera.is_file:
+                # Play files at their own frame rate instead of racing through them
+                time.sleep(1.0 / camera.fps)
+
+        camera.recorder.stop()
+        camera.done = True
+
+    def _inference_loop(self):
+        while not self.stop_event.is_set():
+            self.frame_ready.wait(timeout=0.5)
+            self.frame_ready.clear()
+
+            pending = []
+            for camera in self.cameras:
+                item = camera.latest.get(timeout=0)
+                if item is None:
+                    continue
+                frame, captured_at = item
+
+                if not camera.stride.should_detect() or (
+                        camera.motion_gate is not None and not camera.motion_gate.should_infer(frame)):
+                    # Between keyframes or nothing moved: coast the tracks, so people who left expire
+                    self._publish(camera, camera.tracker.step())
+                else:
+                    pending.append((camera, frame, captured_at))
+
+            for i in range(0, len(pending), self.max_batch):
+                batch = pending[i:i + self.max_batch]
+                start = time.perf_counter()
+                results = self.detector.detect_humans_batch([frame for _, frame, _ in batch])
+                done = time.perf_counter()
+                self.inference_timer.add(done - start)
+                self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+
+                for (camera, _, captured_at), (boxes, confidences) in zip(batch, results):
+                    camera.stride.update(len(boxes))
+                    self._publish(camera, camera.tracker.update(boxes, confidences))
+                    self.latency_timer.add(done - captured_at)
+
+    def _publish(self, camera, tracks):
+        camera.tracks = [(t.id, t.box, t.confidence) for t in tracks]
+        if tracks and camera.recorder.trigger(camera.fps, camera.width, camera.height):
+            print(f"🎥 {camera.name}: {len(tracks)} people detected, recording clip")
+
+    def status(self):
+        """Per-camera state plus the shared inference timings and batch size counts."""
+        return {
+            'cameras': {camera.name: camera.status() for camera in self.cameras},
+            'inference': self.inference_timer.summary(),
+            'latency': self.latency_timer.summary(),
+            'batch_sizes': dict(sorted(self.batch_sizes.items())),
+        }
@@ -0,0 +1,80 @@
+import cv2
+import tempfile
+import threading
+import time
+
+
+class ClipRecorder:
+    """
+    Records a short clip to a temporary MP4 once a person is seen, then hands
+    the file to on_finished (e.g. the Gemini analysis queue).
+    One recorder per camera; start/write/stop may be called from different threads.
+    """
+    def __init__(self, duration=5, on_finished=None, cooldown=2):
+        self.duration = duration
+        self.cooldown = cooldown  # seconds after a trigger before the next one may start a clip
+        self.on_finished = on_finished
+        self.is_recording = False
+        self.start_time = None
+        self.last_trigger_time = 0
+        self.video_path = None
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def trigger(self, fps, width, height):
+        """Starts a clip unless one is already running or the cooldown has not passed. Returns True if it started."""
+        with self._lock:
+            now = time.time()
+            if self.is_recording or now - self.last_trigger_time <= self.cooldown:
+                return False
+            self.last_trigger_time = now
+            self._open(fps, width, height)
+            return True
+
+    def start(self, fps, width, height):
+        """Starts a clip now, ignoring the cooldown."""
+        with self._lock:
+            if not self.is_recording:
+                self._open(fps, width, height)
+
+    def _open(self, fps, width, height):
+        # Create temporary file for recording
+        temp_file = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False)
+        temp_file.close()
+
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        self._writer = cv2.VideoWriter(temp_file.name, fourcc, fps, (width, height))
+        self.video_path = temp_file.name
+        self.start_time = time.time()
+        self.is_recording = True
+
+    def write(self, frame):
+        """Adds a frame to the running clip and closes it once `duration` seconds have passed."""
+        with self._lock:
+            if not self.is_recording or self._writer is None:
+                return
+            self._writer.write(frame)
+            if time.time() - self.start_time < self.duration:
+                return
+        self.stop()
+
+    def stop(self):
+        """Closes the running clip and passes it to on_finished."""
+        with self._lock:
+            if not self.is_recording:
+                return
+            self.is_recording = False
+            writer, self._writer = self._writer, None
+            video_path = self.video_path
+            if writer is None:
+                return
+            writer.release()
+
+        if self.on_finished:
+            self.on_finished(video_path)
+
+    def remaining(self):
+        """Seconds left in the running clip."""
+        if not self.is_recording:
+            return 0
+        return max(0, self.duration - (time.time() - self.start_time))
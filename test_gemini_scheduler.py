@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+import gemini_scheduler
+from gemini_scheduler import LIVE, OFFLINE, GeminiScheduler, TokenBucket, request_priority
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(gemini_scheduler.time, 'monotonic', fake)
+    return fake
+
+
+def test_token_bucket_refills_over_time(clock):
+    bucket = TokenBucket(60)  # one per second
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    clock.now += 0.5
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    clock.now += 100
+    assert bucket.wait_time(1) == 0  # refill stops at capacity
+    assert bucket.level == 60
+
+
+def test_token_bucket_overdraft_and_oversized_requests(clock):
+    bucket = TokenBucket(60)
+    bucket.take(90)  # may go negative, later requests wait longer
+    assert bucket.wait_time(1) == pytest.approx(31.0)
+    # A request larger than the bucket only waits for a full bucket
+    assert bucket.wait_time(600) == pytest.approx(90.0)
+
+
+def test_unlimited_bucket_never_waits():
+    bucket = TokenBucket(0)
+    bucket.take(10 ** 9)
+    assert bucket.wait_time(10 ** 9) == 0
+
+
+def test_live_requests_run_ahead_of_offline():
+    async def run():
+        scheduler = GeminiScheduler(rpm=0, tpm=0)
+        order = []
+
+        async def request(name, priority):
+            with request_priority(priority):
+                await scheduler.call(order.append, name, rate_limited=True)
+
+        # Hold the queue so everything is waiting when it opens
+        scheduler._paused_until = time.monotonic() + 0.2
+        tasks = [asyncio.create_task(request('offline-1', OFFLINE)),
+                 asyncio.create_task(request('offline-2', OFFLINE))]
+        await asyncio.sleep(0.05)
+        tasks.append(asyncio.create_task(request('live', LIVE)))
+        await asyncio.gather(*tasks)
+        return order, scheduler.stats()
+
+    order, stats = asyncio.run(run())
+    assert order == ['live', 'offline-1', 'offline-2']
+    assert stats['calls'] == 3
+    assert stats['queue_wait_ms']['live']['count'] == 1
+
+
+def test_rate_limited_calls_are_retried_and_pause_the_queue():
+    attempts = []
+
+    def flaky():
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            raise api_exceptions.TooManyRequests('quota')
+        return 'ok'
+
+    async def run():
+        scheduler = GeminiScheduler(rpm=0, tpm=0, backoff_initial=0.01, backoff_max=0.05)
+        before = time.monotonic()
+        result = await scheduler.call(flaky, rate_limited=True)
+        return result, scheduler, before
+
+    result, scheduler, before = asyncio.run(run())
+    assert result == 'ok'
+    assert len(attempts) == 3
+    assert scheduler.counters['retries'] == 2
+    assert scheduler.counters['rate_limited'] == 2
+    assert scheduler._paused_until > before
+
+
+def test_errors_not_worth_retrying_fail_straight_away():
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise ValueError('bad request')
+
+    scheduler = GeminiScheduler(backoff_initial=0.01)
+    with pytest.raises(ValueError):
+        asyncio.run(scheduler.call(broken))
+    assert len(calls) == 1
+    assert scheduler.counters['failed'] == 1
+
+
+def test_retries_give_up_after_max_retries():
+    calls = []
+
+    def unavailable():
+        calls.append(1)
+        raise api_exceptions.ServiceUnavailable('down')
+
+    scheduler = GeminiScheduler(max_retries=2, backoff_initial=0.01, backoff_max=0.01)
+    with pytest.raises(api_exceptions.ServiceUnavailable):
+        asyncio.run(scheduler.call(unavailable))
+    assert len(calls) == 3
+    assert scheduler.counters['retries'] == 2
+    assert scheduler.counters['rate_limited'] == 0
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from incidents import IncidentStreamParser, incident_to_alert
+
+INCIDENTS = [
+    {'start': '0:05', 'end': '0:12', 'type': 'VIOLENCE_DETECTED',
+     'description': 'Man says "stop}" and pushes {another} man'},
+    {'start': '1:02:03', 'end': '1:02:09', 'type': 'SUSPICIOUS_BEHAVIOR',
+     'description': 'Back\\slash \\" and [brackets] inside a string'},
+    {'start': '2:00', 'end': '2:10', 'type': 'VIOLENCE_DETECTED', 'description': 'nested',
+     'extra': {'people': [{'id': 1}, {'id': 2}]}},
+]
+
+
+def feed_in_chunks(text, size):
+    parser = IncidentStreamParser()
+    incidents = []
+    for i in range(0, len(text), size):
+        incidents.extend(parser.feed(text[i:i + size]))
+    return parser, incidents
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, 50])
+def test_incidents_split_at_any_chunk_boundary(size):
+    text = json.dumps(INCIDENTS, indent=1)
+    parser, incidents = feed_in_chunks(text, size)
+    assert incidents == INCIDENTS
+    assert parser.complete
+    assert ''.join(parser.text) == text
+
+
+def test_incidents_are_returned_as_soon_as_their_object_closes():
+    parser = IncidentStreamParser()
+    text = json.dumps(INCIDENTS[:2])
+    first_end = text.index('}, {') + 1
+    assert parser.feed(text[:first_end]) == INCIDENTS[:1]
+    assert not parser.complete
+    assert parser.feed(text[first_end:]) == INCIDENTS[1:2]
+    assert parser.complete
+
+
+def test_empty_array_and_truncated_stream():
+    parser, incidents = feed_in_chunks('[]', 1)
+    assert incidents == [] and parser.complete
+
+    text = json.dumps(INCIDENTS)
+    parser, incidents = feed_in_chunks(text[:text.index('1:02:03')], 7)
+    assert incidents == INCIDENTS[:1]
+    assert not parser.complete
+
+
+def test_incident_to_alert():
+    alert = incident_to_alert(INCIDENTS[1])
+    assert (alert['start_time'], alert['end_time']) == (3723.0, 3729.0)
+    assert alert['type'] == 'SUSPICIOUS_BEHAVIOR'
+
+    # End before start gets the default window, unknown types count as violence
+    alert = incident_to_alert({'start': 30, 'end': '0:10', 'type': 'OTHER', 'description': ' x '})
+    assert (alert['start_time'], alert['end_time'], alert['type'], alert['description']) == \
+        (30.0, 35.0, 'VIOLENCE_DETECTED', 'x')
+
+    assert incident_to_alert({'end': '0:10'}) is None
+    assert incident_to_alert({'start': 'soon'}) is None
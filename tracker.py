@@ -0,0 +1,128 @@
+import itertools
+import numpy as np
+
+
+def box_iou(boxes_a, boxes_b):
+    """IoU matrix between two lists of [x, y, w, h] boxes."""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    ax2, ay2 = a[:, 0] + a[:, 2], a[:, 1] + a[:, 3]
+    bx2, by2 = b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+
+    inter_w = np.clip(np.minimum(ax2[:, None], bx2[None]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    inter_h = np.clip(np.minimum(ay2[:, None], by2[None]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = inter_w * inter_h
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+def box_to_state(box):
+    """[x, y, w, h] -> [center x, center y, area, aspect ratio]"""
+    x, y, w, h = box
+    return np.array([x + w / 2.0, y + h / 2.0, w * h, w / float(max(h, 1))], dtype=np.float64)
+
+
+def state_to_box(state):
+    """[center x, center y, area, aspect ratio] -> [x, y, w, h]"""
+    area = max(state[2], 1.0)
+    w = np.sqrt(area * max(state[3], 1e-3))
+    h = area / w
+    return [int(round(state[0] - w / 2.0)), int(round(state[1] - h / 2.0)), int(round(w)), int(round(h))]
+
+
+class Track:
+    """
+    One tracked person, with a constant-velocity Kalman filter over
+    [cx, cy, area, aspect, vx, vy, v_area] (the SORT motion model).
+    """
+    # Constant velocity transition and measurement matrices
+    F = np.eye(7)
+    F[0, 4] = F[1, 5] = F[2, 6] = 1
+    H = np.eye(4, 7)
+    Q = np.diag([1, 1, 1, 1, 0.01, 0.01, 0.0001])
+    R = np.diag([1, 1, 10, 10])
+
+    def __init__(self, track_id, box, confidence):
+        self.id = track_id
+        self.x = np.zeros(7)
+        self.x[:4] = box_to_state(box)
+        self.P = np.diag([10, 10, 10, 10, 10000, 10000, 10000]).astype(np.float64)
+        self.confidence = confidence
+        self.hits = 1
+        self.age = 0
+        self.time_since_update = 0
+
+    @property
+    def box(self):
+        return state_to_box(self.x)
+
+    def predict(self):
+        """Advances the track by one frame."""
+        # Keep the area from going negative
+        if self.x[2] + self.x[6] <= 0:
+            self.x[6] = 0
+        self.x = self.F @ self.x
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        self.age += 1
+        self.time_since_update += 1
+
+    def update(self, box, confidence):
+        """Corrects the track with a matched detection."""
+        y = box_to_state(box) - self.H @ self.x
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(7) - K @ self.H) @ self.P
+        self.confidence = confidence
+        self.hits += 1
+        self.time_since_update = 0
+
+
+class SortTracker:
+    """
+    SORT-style multi-object tracker (Kalman prediction + IoU association), NumPy only.
+    Call update() with the detector output on keyframes and step() on the
+    frames in between; both return the confirmed tracks for that frame.
+    """
+    def __init__(self, iou_threshold=0.3, min_hits=2, max_age=10):
+        self.iou_threshold = iou_threshold
+        self.min_hits = min_hits  # detections needed before a track is reported
+        self.max_age = max_age  # frames a track survives without a matching detection
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def step(self):
+        """Predicts every track one frame ahead without running the detector."""
+        for track in self.tracks:
+            track.predict()
+        self.tracks = [t for t in self.tracks if t.time_since_update <= self.max_age]
+        return self.active_tracks()
+
+    def update(self, boxes, confidences):
+        """Predicts one frame ahead and associates the detections with the tracks."""
+        for track in self.tracks:
+            track.predict()
+
+        unmatched = set(range(len(boxes)))
+        if len(boxes) > 0 and self.tracks:
+            iou = box_iou(boxes, [t.box for t in self.tracks])
+            # Greedy association, best overlaps first
+            matched_tracks = set()
+            for i, j in zip(*np.unravel_index(np.argsort(-iou, axis=None), iou.shape)):
+                if iou[i, j] < self.iou_threshold:
+                    break
+                if i not in unmatched or j in matched_tracks:
+                    continue
+                self.tracks[j].update(boxes[i], confidences[i])
+                unmatched.discard(i)
+                matched_tracks.add(j)
+
+        for i in sorted(unmatched):
+            self.tracks.append(Track(next(self._ids), boxes[i], confidences[i]))
+
+        self.tracks = [t for t in self.tracks if t.time_since_update <= self.max_age]
+        return self.active_tracks()
+
+    def active_tracks(self):
+        """Tracks that have been confirmed by at least min_hits detections."""
+        return [t for t in self.tracks if t.hits >= self.min_hits]
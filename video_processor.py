@@ -2,110 +2,365 @@ import cv2
 import os
 import time
 import re
-from gemini_analyzer import analyze_video_clip, analyze_full_video_with_timestamps
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
+import gemini_analyzer
+from gemini_analyzer import analyze_video_clip, analyze_full_video_with_timestamps, analyze_full_video_incidents, \
+    is_analysis_error
+from analysis_cache import get_cache, file_sha256, make_key
+from media_tools import iter_segment_stream_copy
+from ingest import probe_video
+from activity_screen import ANALYSIS_CASCADE, CASCADE_VERSION, get_screener, screening_summary
+from highlight_reel import HIGHLIGHT_REEL, HIGHLIGHT_MIN_SECONDS, HIGHLIGHT_VERSION, active_intervals, \
+    worth_condensing, build_highlight_reel
+
+CLIP_DURATION_SECONDS = 10
+
+# How many clips may be in Gemini (upload, processing, generation) at the same time
+GEMINI_CONCURRENCY = int(os.getenv('GEMINI_CONCURRENCY', '3'))
+
+
+class AnalysisIncomplete(RuntimeError):
+    """
+    A full-video analysis did not finish (Gemini error, quota exhausted, interrupted
+    stream), so its alerts are not a verdict on the video. alerts holds any that
+    arrived before the failure.
+    """
+    def __init__(self, alerts):
+        super().__init__("Video was not fully analyzed (Gemini error or quota exceeded), try again later")
+        self.alerts = alerts
+
+
+class InvalidVideo(ValueError):
+    """The video cannot be analyzed at all (missing, unreadable, empty); retrying will not help."""
 
 def format_time(seconds):
     """Converts seconds into a MM:SS formatted string."""
     return time.strftime('%M:%S', time.gmtime(seconds))
 
-def process_video(video_path):
+def iter_clips(video_path, clip_duration_seconds=CLIP_DURATION_SECONDS, stream_copy=True):
+    """
+    Yields (clip_number, start_seconds, end_seconds, clip_path) for consecutive clips of a video.
+    Memory use is constant: clips are cut with ffmpeg stream copy (keyframe aligned, no
+    re-encode) when possible, each one handed out as soon as ffmpeg finishes it; otherwise
+    (or from where stream copy failed) frames are written to the clip file as they are decoded.
+    The caller owns each clip file and should delete it when done.
+    """
+    base_filename = os.path.basename(video_path)
+    name, _ = os.path.splitext(base_filename)
+    output_dir = os.path.dirname(video_path)
+
+    clip_number, resume_at = 0, 0.0
+    if stream_copy:
+        segments = iter_segment_stream_copy(video_path, output_dir, clip_duration_seconds, name)
+        try:
+            while True:
+                try:
+                    clip_path, start, end = next(segments)
+                except StopIteration as done:
+                    complete = done.value
+                    break
+                yield clip_number, start, end, clip_path
+                clip_number, resume_at = clip_number + 1, end
+        finally:
+            segments.close()  # stops ffmpeg and removes unused segments if the caller stopped early
+        if complete:
+            return
+        print(f"Stream copy not available, re-encoding clips from {resume_at:.1f}s instead.")
+
+    yield from iter_reencoded_clips(video_path, output_dir, name, clip_duration_seconds, resume_at, clip_number)
+
+def iter_reencoded_clips(video_path, output_dir, name, clip_duration_seconds, start_seconds=0.0, first_clip=0):
+    """
+    Streams decoded frames straight into per-clip mp4v files, one clip open at a time,
+    from start_seconds on, numbering clips from first_clip.
+    """
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if fps == 0:
+        fps = 30  # Fallback FPS
+    frames_per_clip = int(fps * clip_duration_seconds)
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    if start_seconds:
+        cap.set(cv2.CAP_PROP_POS_MSEC, start_seconds * 1000)
+
+    clip_number = first_clip
+    try:
+        while True:
+            out = None
+            frames_written = 0
+            clip_path = os.path.join(output_dir, f"{name}_clip_{clip_number}.mp4")
+            while frames_written < frames_per_clip:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if out is None:
+                    height, width, _ = frame.shape
+                    out = cv2.VideoWriter(clip_path, fourcc, fps, (width, height))
+                out.write(frame)
+                frames_written += 1
+
+            if out is None:
+                break
+            out.release()
+
+            start_time_seconds = start_seconds + (clip_number - first_clip) * clip_duration_seconds
+            end_time_seconds = start_time_seconds + (frames_written / fps)
+            yield clip_number, start_time_seconds, end_time_seconds, clip_path
+            clip_number += 1
+    finally:
+        cap.release()
+
+def process_video(video_path, max_concurrency=None, content_hash=None, progress=None, cascade=None):
     """
     Original function for splitting video into clips.
     Kept for backwards compatibility.
+    Clips are analyzed by up to max_concurrency (GEMINI_CONCURRENCY) Gemini calls at once
+    while the next clips are being cut; results come back in timestamp order.
+    With cascade (ANALYSIS_CASCADE by default) each clip is screened locally first and
+    clips without moving people are not sent to Gemini ('screened_locally' is True).
+    Results are cached by video content, so the same video is only analyzed once.
+    progress(stage, **details), if given, reports how many clips have been analyzed.
+    """
+    if not os.path.exists(video_path):
+        print("Error: Could not open video file.")
+        return [{"error": "Could not open video file."}]
+    cascade = ANALYSIS_CASCADE if cascade is None else cascade
+    key = _clips_cache_key(video_path, content_hash, cascade)
+    return get_cache().get_or_compute(key, lambda: _process_video(video_path, max_concurrency, progress, cascade),
+                                      label=os.path.basename(video_path))
+
+def iter_process_video(video_path, max_concurrency=None, content_hash=None, cascade=None):
+    """
+    process_video as a generator: yields each clip's result as soon as its analysis
+    finishes, so results arrive in completion order ('clip' gives the position).
+    A cached video is replayed from the cache; a fresh complete run is stored in it.
+    Closing the generator early stops cutting clips and skips the remaining analyses.
+    """
+    if not os.path.exists(video_path):
+        print("Error: Could not open video file.")
+        yield {"error": "Could not open video file."}
+        return
+    cascade = ANALYSIS_CASCADE if cascade is None else cascade
+    key = _clips_cache_key(video_path, content_hash, cascade)
+    cached = get_cache().get(key)
+    if cached is not None:
+        print(f"Returning cached analysis for {os.path.basename(video_path)}")
+        get_cache().add_label(key, os.path.basename(video_path))
+        yield from cached
+        return
+
+    results = []
+    for result in _iter_clip_analyses(video_path, max_concurrency, cascade=cascade):
+        results.append(result)
+        yield result
+
+    results.sort(key=lambda r: r.get('clip', 0))
+    if _clip_results_cacheable(results):
+        get_cache().put(key, results, label=os.path.basename(video_path))
+
+def _clips_cache_key(video_path, content_hash, cascade):
+    version = f"{gemini_analyzer.CLIP_ANALYSIS_VERSION}/{CLIP_DURATION_SECONDS}s"
+    if cascade:
+        version += f"/{CASCADE_VERSION}"
+    return make_key(content_hash or file_sha256(video_path), 'clips', version)
+
+def _clip_results_cacheable(results):
+    return not gemini_analyzer.DEMO_MODE and not any('error' in r or is_analysis_error(r['analysis']) for r in results)
+
+def _process_video(video_path, max_concurrency, progress=None, cascade=False):
+    """process_video without the cache. Returns (results, cacheable)."""
+    results = sorted(_iter_clip_analyses(video_path, max_concurrency, progress, cascade),
+                     key=lambda r: r.get('clip', 0))
+    return results, _clip_results_cacheable(results)
+
+def _screen_video(video_path):
+    """Local cascade screen of a clip or video, or None if it could not be screened (it then goes to Gemini)."""
+    try:
+        return get_screener().screen(video_path)
+    except Exception as e:
+        print(f"WARNING: Local screening failed for {video_path}, sending it to Gemini: {e}")
+        return None
+
+def _iter_clip_analyses(video_path, max_concurrency, progress=None, cascade=False):
+    """
+    Cuts clips on a background thread and analyzes them on up to max_concurrency
+    workers, yielding each result as soon as it is ready.
+    With cascade, clips without moving people are answered locally instead of by Gemini.
     """
     print(f"Processing video: {video_path}")
-    all_results = []
+    max_concurrency = max_concurrency or GEMINI_CONCURRENCY
     
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         print("Error: Could not open video file.")
-        return [{"error": "Could not open video file."}]
+        yield {"error": "Could not open video file."}
+        return
+    cap.release()
 
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    if fps == 0:
-        fps = 30  # Fallback FPS
+    # Bounds how many clips are handed to the analysis pool ahead of a free Gemini slot; the
+    # cutter stops taking clips beyond that, though ffmpeg stream copy keeps cutting ahead on disk
+    pending_clips = threading.BoundedSemaphore(max_concurrency * 2)
+    finished = queue.Queue()
+    stop = threading.Event()
+    submitted = []  # (future, clip_path), so clips of cancelled analyses can be cleaned up
+    submit_lock = threading.Lock()
+    clips_cut = 0
+    clips_screened = 0
 
-    clip_duration_seconds = 10
-    frames_per_clip = int(fps * clip_duration_seconds)
-    clip_number = 0
-    
-    while True:
-        frames_for_current_clip = []
-        for _ in range(frames_per_clip):
-            ret, frame = cap.read()
-            if not ret:
-                break
-            frames_for_current_clip.append(frame)
-        
-        if not frames_for_current_clip:
-            break
-
-        start_time_seconds = clip_number * clip_duration_seconds
-        end_time_seconds = start_time_seconds + (len(frames_for_current_clip) / fps)
-        timestamp_str = f"{format_time(start_time_seconds)} - {format_time(end_time_seconds)}"
-
-        base_filename = os.path.basename(video_path)
-        name, _ = os.path.splitext(base_filename)
-        output_dir = os.path.dirname(video_path)
-        clip_filename = f"{name}_clip_{clip_number}.mp4"
-        clip_path = os.path.join(output_dir, clip_filename)
-        
-        height, width, _ = frames_for_current_clip[0].shape
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(clip_path, fourcc, fps, (width, height))
-        
-        for f in frames_for_current_clip:
-            out.write(f)
-        out.release()
-        
-        analysis_result = analyze_video_clip(clip_path)
+    def analyze_clip(clip_number, clip_path, timestamp_str):
+        try:
+            if stop.is_set():
+                return
+            screen = _screen_video(clip_path) if cascade else None
+            screened_locally = screen is not None and not screen['active']
+            if screened_locally:
+                analysis_result = screening_summary(screen)
+            else:
+                analysis_result = analyze_video_clip(clip_path)
 
-        print("\n" + "="*50)
-        print(f"ANALYSIS FOR TIMESTAMP {timestamp_str}:")
-        print(analysis_result)
-        print("="*50 + "\n")
+            print("\n" + "="*50)
+            print(f"ANALYSIS FOR TIMESTAMP {timestamp_str}:")
+            print(analysis_result)
+            print("="*50 + "\n")
 
-        all_results.append({
-            'timestamp': timestamp_str,
-            'analysis': analysis_result
-        })
-        
+            finished.put({
+                'clip': clip_number,
+                'timestamp': timestamp_str,
+                'analysis': analysis_result,
+                'screened_locally': screened_locally
+            })
+        except Exception as e:
+            finished.put(e)
+        finally:
+            try:
+                os.remove(clip_path)
+            except OSError as e:
+                print(f"Error removing clip {clip_path}: {e}")
+            pending_clips.release()
+
+    def cut_clips():
+        nonlocal clips_cut
         try:
-            os.remove(clip_path)
-        except OSError as e:
-            print(f"Error removing clip {clip_path}: {e}")
+            for clip_number, start_time_seconds, end_time_seconds, clip_path in iter_clips(video_path):
+                timestamp_str = f"{format_time(start_time_seconds)} - {format_time(end_time_seconds)}"
+                pending_clips.acquire()
+                with submit_lock:
+                    if stop.is_set():
+                        pending_clips.release()
+                        os.remove(clip_path)
+                        break
+                    submitted.append((executor.submit(analyze_clip, clip_number, clip_path, timestamp_str),
+                                      clip_path))
+                clips_cut += 1
+        except Exception as e:
+            finished.put(e)
+        finally:
+            finished.put(None)  # no more clips
 
-        clip_number += 1
-        
-    cap.release()
-    print("Finished processing all video clips.")
-    return all_results
+    if progress:
+        progress('splitting')
+    executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='gemini-clip')
+    cutter = threading.Thread(target=cut_clips, name='clip-cutter', daemon=True)
+    cutter.start()
+    try:
+        clips_done = 0
+        cutting_done = False
+        while not cutting_done or clips_done < clips_cut:
+            item = finished.get()
+            if item is None:
+                cutting_done = True
+                continue
+            if isinstance(item, Exception):
+                raise item
+            clips_done += 1
+            clips_screened += item['screened_locally']
+            if progress:
+                progress('analyzing', clips_done=clips_done, clips_cut=clips_cut, clips_screened=clips_screened)
+            yield item
+        print(f"Finished processing all video clips ({clips_screened} of {clips_done} screened out locally).")
+    finally:
+        # Return straight away (e.g. the client disconnected): clips not started yet are
+        # cancelled, running ones finish on their own, and the cutter stops at its next clip
+        with submit_lock:
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            for future, clip_path in submitted:
+                if future.cancelled():
+                    try:
+                        os.remove(clip_path)
+                    except OSError:
+                        pass
+                    pending_clips.release()
 
-def analyze_full_video(video_path):
+def analyze_full_video(video_path, content_hash=None, video_info=None, progress=None, cascade=None,
+                       highlights=None, on_alert=None):
     """
     Analyzes the full video without splitting and returns timestamps of incidents.
+    With cascade (ANALYSIS_CASCADE by default) a video without moving people is
+    screened out locally and never uploaded.
+    With highlights (HIGHLIGHT_REEL by default) a long video is condensed to the
+    intervals where people are moving, and the reel is uploaded instead; the
+    timestamps Gemini reports are mapped back to the original video.
+    With STREAM_INCIDENTS the model streams a JSON incident list and on_alert(alert),
+    if given, is called for each alert as soon as it arrives (not for cached results).
+    Results are cached by video content, so the same video is only analyzed once.
+    Raises InvalidVideo if the file cannot be read as a video, and AnalysisIncomplete
+    if Gemini did not fully analyze it (nothing is cached in either case).
+    content_hash / video_info come from ingest when the upload was hashed and probed on arrival.
+    progress(stage), if given, is called at each stage
+    (screening, condensing, uploading, processing, analyzing, parsing).
     """
+    if not os.path.exists(video_path):
+        print(f"ERROR: Video file does not exist at {video_path}")
+        raise InvalidVideo("Video file does not exist")
+    cascade = ANALYSIS_CASCADE if cascade is None else cascade
+    highlights = HIGHLIGHT_REEL if highlights is None else highlights
+    version = gemini_analyzer.FULL_VIDEO_ANALYSIS_VERSION
+    if cascade:
+        version += f"/{CASCADE_VERSION}"
+    if highlights:
+        version += f"/{HIGHLIGHT_VERSION}"
+    key = make_key(content_hash or file_sha256(video_path), 'full', version)
+
+    def compute():
+        alerts, cacheable = _analyze_full_video(video_path, video_info, progress, cascade, highlights, on_alert)
+        # Demo results are not cached but are complete; anything else not cacheable failed part way,
+        # and raising also fails the requests waiting on the same analysis
+        if not cacheable and not gemini_analyzer.DEMO_MODE:
+            raise AnalysisIncomplete(alerts)
+        return alerts, cacheable
+
+    return get_cache().get_or_compute(key, compute, label=os.path.basename(video_path))
+
+def _active_intervals(video_path, duration):
+    """Human-active intervals of the video, or None if they could not be found (the whole video is then sent)."""
+    try:
+        return active_intervals(video_path, duration)
+    except Exception as e:
+        print(f"WARNING: Could not find active intervals in {video_path}, sending the whole video: {e}")
+        return None
+
+def _analyze_full_video(video_path, video_info=None, progress=None, cascade=False, highlights=False,
+                        on_alert=None):
+    """analyze_full_video without the cache. Returns (alerts, cacheable)."""
     print(f"\n{'='*60}")
     print(f"FULL VIDEO ANALYSIS STARTED")
     print(f"Video path: {video_path}")
     print(f"{'='*60}\n")
     
     try:
-        # Verify file exists
-        if not os.path.exists(video_path):
-            print(f"ERROR: Video file does not exist at {video_path}")
-            return []
-        
-        # Get video information
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
+        # Get video information (already known if the upload was probed during ingest)
+        if video_info is None:
+            video_info = probe_video(video_path)
+        if video_info is None:
             print(f"ERROR: Cannot open video file {video_path}")
-            return []
+            raise InvalidVideo("Cannot open video file")
         
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        duration = frame_count / fps if fps > 0 else 0
-        cap.release()
+        fps = video_info['fps']
+        frame_count = video_info['frame_count']
+        duration = video_info['duration']
         
         print(f"Video Information:")
         print(f"  - FPS: {fps}")
@@ -115,19 +370,57 @@ def analyze_full_video(video_path):
         
         if duration == 0:
             print("ERROR: Video has zero duration")
-            return []
+            raise InvalidVideo("Video has zero duration")
         
-        # Send full video to Gemini for analysis
-        print("\nSending video to Gemini API for analysis...")
-        analysis_text = analyze_full_video_with_timestamps(video_path, duration)
+        reel = None
+        if highlights and duration >= HIGHLIGHT_MIN_SECONDS:
+            # One full detector pass finds the active intervals; it also screens the video
+            if progress:
+                progress('screening')
+            intervals = _active_intervals(video_path, duration)
+            if intervals == [] and cascade:
+                print("\nScene appears normal. (Locally screened: no moving people; not sent to Gemini)")
+                return [], True
+            if intervals and worth_condensing(intervals, duration):
+                if progress:
+                    progress('condensing')
+                reel = build_highlight_reel(video_path, intervals)
+        elif cascade:
+            if progress:
+                progress('screening')
+            screen = _screen_video(video_path)
+            if screen is not None and not screen['active']:
+                print(f"\n{screening_summary(screen)}")
+                return [], True
+
+        if gemini_analyzer.STREAM_INCIDENTS and not gemini_analyzer.DEMO_MODE:
+            return _stream_incidents(video_path, duration, reel, progress, on_alert)
+
+        if reel is not None:
+            # Send the condensed video (already in the proxy profile) and map its timestamps back
+            print(f"\nSending {reel.duration:.0f}s highlight reel of {len(reel.intervals)} active intervals "
+                  f"(of {duration:.0f}s) to Gemini API for analysis...")
+            try:
+                analysis_text = analyze_full_video_with_timestamps(reel.path, reel.duration, progress, proxy=False)
+            finally:
+                reel.discard()
+        else:
+            # Send full video to Gemini for analysis
+            print("\nSending video to Gemini API for analysis...")
+            analysis_text = analyze_full_video_with_timestamps(video_path, duration, progress)
         
-        print(f"\nGemini API Response:")
+        print(f"\nGemini API Response{' (highlight reel time)' if reel is not None else ''}:")
         print("-" * 40)
         print(analysis_text)
         print("-" * 40)
         
         # Parse the analysis to extract timestamps
+        if progress:
+            progress('parsing')
         alerts = parse_timestamps_from_analysis(analysis_text)
+        if reel is not None:
+            # Parsed in reel time (always short), then mapped back to the original video
+            alerts = reel.remap_alerts(alerts)
         
         print(f"\nAnalysis Summary:")
         print(f"  - Total alerts found: {len(alerts)}")
@@ -135,13 +428,45 @@ def analyze_full_video(video_path):
             for i, alert in enumerate(alerts, 1):
                 print(f"  - Alert {i}: {alert['type']} from {alert['start_time']:.1f}s to {alert['end_time']:.1f}s")
         
-        return alerts
+        return alerts, not gemini_analyzer.DEMO_MODE and not is_analysis_error(analysis_text)
         
+    except InvalidVideo:
+        raise
     except Exception as e:
         print(f"\nERROR in analyze_full_video: {str(e)}")
         import traceback
         traceback.print_exc()
-        return []
+        return [], False
+
+def _stream_incidents(video_path, duration, reel, progress=None, on_alert=None):
+    """
+    Full-video analysis as a streamed JSON incident list: alerts are handed to
+    on_alert as they are decoded, with reel times mapped back to the original.
+    Returns (alerts, cacheable).
+    """
+    def deliver(alert):
+        if reel is not None:
+            reel.remap_alerts([alert])
+        if on_alert:
+            on_alert(alert)
+
+    if reel is not None:
+        print(f"\nStreaming {reel.duration:.0f}s highlight reel of {len(reel.intervals)} active intervals "
+              f"(of {duration:.0f}s) to Gemini API for analysis...")
+        try:
+            alerts, complete = analyze_full_video_incidents(reel.path, reel.duration, deliver, progress, proxy=False)
+        finally:
+            reel.discard()
+    else:
+        print("\nStreaming video to Gemini API for analysis...")
+        alerts, complete = analyze_full_video_incidents(video_path, duration, deliver, progress)
+
+    alerts.sort(key=lambda alert: alert['start_time'])
+    print(f"\nAnalysis Summary:")
+    print(f"  - Total alerts found: {len(alerts)}{'' if complete else ' (analysis incomplete)'}")
+    for i, alert in enumerate(alerts, 1):
+        print(f"  - Alert {i}: {alert['type']} from {alert['start_time']:.1f}s to {alert['end_time']:.1f}s")
+    return alerts, complete
 
 def parse_timestamps_from_analysis(analysis_text):
     """
@@ -1,31 +1,42 @@
+import asyncio
 import cv2
 import numpy as np
-import urllib.request
 import os
 import time
 import google.generativeai as genai
 from datetime import datetime
 import threading
 import queue
-import tempfile
+from adaptive_stride import AdaptiveStride
+from model_registry import get_model, resolve_input_size
+from yolo_postprocess import YOLOPostprocessor
+from tracker import SortTracker
+from motion_gate import MotionGate
+from live_pipeline import LivePipeline
+from recorder import ClipRecorder
+import gemini_service
+from keyframes import extract_keyframes
+from gemini_scheduler import LIVE, request_priority
+
+# How finished live clips are sent to Gemini: 'keyframes' (inline JPEG frames, no upload wait) or 'video'
+LIVE_CLIP_INPUT = os.getenv('LIVE_CLIP_INPUT', 'keyframes')
 
 class YOLODetection:
     # constructor, default values set to .5 and .4
     # enables us to do adjust values if we need to later
-    def __init__(self, confidence_threshold=0.5, nms_threshold=0.4, gemini_api_key=None):
+    # model_name / input_size pick an entry from the model catalogue (e.g. 'yolov4-tiny', 320)
+    def __init__(self, confidence_threshold=0.5, nms_threshold=0.4, gemini_api_key=None,
+                 model_name=None, input_size=None):
         self.confidence_threshold = confidence_threshold
         self.nms_threshold = nms_threshold
         self.gemini_api_key = gemini_api_key
-        self.YOLO_setup()
+        self.clip_input = LIVE_CLIP_INPUT
+        self.YOLO_setup(model_name, input_size)
         self.gemini_setup()
         
-        # Video recording variables
-        self.is_recording = False
-        self.current_recording = None
-        self.recording_start_time = None
-        self.recording_duration = 5  # 10 seconds
-        self.frame_buffer = []
+        # Video recording, finished clips go to the analysis queue
         self.analysis_queue = queue.Queue()
+        self.recorder = ClipRecorder(duration=5, on_finished=self.analysis_queue.put)
         
         # Start analysis thread
         self.analysis_thread = threading.Thread(target=self.process_analysis_queue, daemon=True)
@@ -39,78 +50,59 @@ class YOLODetection:
             return
             
         try:
-            genai.configure(api_key=self.gemini_api_key)
-            self.gemini_model = genai.GenerativeModel('gemini-2.5-flash')
+            gemini_service.configure(self.gemini_api_key)
+            self.gemini_model_name = 'gemini-2.5-flash'
+            self.gemini_model = genai.GenerativeModel(self.gemini_model_name)
             print("✓ Gemini model initialized successfully")
         except Exception as e:
             print(f"✗ Error initializing Gemini: {e}")
             self.gemini_model = None
 
-    def YOLO_setup(self):
-        files = {
-            'yolov4.weights' : 'https://github.com/AlexeyAB/darknet/releases/download/darknet_yolo_v3_optimal/yolov4.weights',
-            'yolov4.cfg': 'https://raw.githubusercontent.com/AlexeyAB/darknet/master/cfg/yolov4.cfg',
-        }
-
-        for filename, url in files.items():
-            if not os.path.exists(filename):
-                try:
-                    urllib.request.urlretrieve(url, filename)
-                except Exception as e:
-                    print(f"✗ Error downloading {filename}: {e}")
-                
+    # attach the shared YOLO network, weights are loaded on first use (or by model_registry.warm_up)
+    def YOLO_setup(self, model_name=None, input_size=None):
+        self.model = get_model(model_name)
+        self.input_size = resolve_input_size(self.model.name, input_size)
+        self.postprocessor = YOLOPostprocessor(input_size=self.input_size)
 
-        # load YOLO network  
-        try:
-            self.net = cv2.dnn.readNet('yolov4.weights', 'yolov4.cfg')
-            layer_names = self.net.getLayerNames()
-            self.output_layers = [layer_names[i -1] for i in self.net.getUnconnectedOutLayers()]
-        except Exception as e:
-            print(f"✗ Error loading YOLO model: {e}")
+    def load_model(self):
+        model = self.model.load()
+        self.postprocessor.class_id = model.person_class_id
+        return model
 
     #Detect humans in openCV frame using YOLO
     def detect_humans(self, frame):
         height, width = frame.shape[:2]
-        blob = cv2.dnn.blobFromImage(frame, 1/255.0, (416,416), (0,0,0), swapRB=True, crop=False)
-        self.net.setInput(blob)
-        outputs = self.net.forward(self.output_layers)
-
-        boxes, confidences = [], []
-
-        for output in outputs:
-            for detection in output:
-                scores = detection[5:]
-                class_id = np.argmax(scores)
-                confidence = scores[class_id]
-                if class_id == 0 and confidence > self.confidence_threshold:
-                    cx = int(detection[0]*width)
-                    cy = int(detection[1]*height)
-                    w = int(detection[2]*width)
-                    h = int(detection[3]*height)
-                    x = max(0, cx - w//2)
-                    y = max(0, cy - h//2)
-                    w = min(w, width - x)
-                    h = min(h, height - y)
-                    boxes.append([x,y,w,h])
-                    confidences.append(float(confidence))
-
-        if len(boxes) > 0:
-            indices = cv2.dnn.NMSBoxes(boxes, confidences, self.confidence_threshold, self.nms_threshold)
-            if len(indices) > 0:
-                final_boxes = [boxes[i] for i in indices.flatten()]
-                final_confidences = [confidences[i] for i in indices.flatten()]
-                return final_boxes, final_confidences
-        return [], []
+        model = self.load_model()
+        with model.lock:
+            outputs = self.postprocessor.forward(model.net, model.output_layers, [frame])
+            return self.postprocessor.detect(outputs, width, height,
+                                             self.confidence_threshold, self.nms_threshold, clip=True)
+
+    # Detect humans in several frames (from one or more sources) with a single forward pass
+    # returns a (boxes, confidences) pair per frame
+    def detect_humans_batch(self, frames):
+        model = self.load_model()
+        with model.lock:
+            return self.postprocessor.detect_batch(model.net, model.output_layers, frames,
+                                                   self.confidence_threshold, self.nms_threshold, clip=True)
     
+    @property
+    def is_recording(self):
+        return self.recorder.is_recording
+
+    @property
+    def recording_duration(self):
+        return self.recorder.duration
+
+    @recording_duration.setter
+    def recording_duration(self, seconds):
+        self.recorder.duration = seconds
+
     # record for gemini API
     def start_recording(self, cap):
         if self.is_recording:
             return  # Already recording
             
-        self.is_recording = True
-        self.recording_start_time = time.time()
-        self.frame_buffer = []
-        
         # Get video properties
         fps = int(cap.get(cv2.CAP_PROP_FPS))
         if fps == 0:
@@ -118,60 +110,32 @@ class YOLODetection:
             
         width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        
-        # Create temporary file for recording
-        temp_file = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False)
-        temp_file.close()
-        
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        self.current_recording = cv2.VideoWriter(temp_file.name, fourcc, fps, (width, height))
-        self.temp_video_path = temp_file.name
-        
+        self.open_recording(fps, width, height)
+
+    # start a recording with known video properties (used when the capture lives on another thread)
+    def open_recording(self, fps, width, height):
+        self.recorder.start(fps, width, height)
 
+    # write frame to the clip, stops by itself after recording_duration seconds
     def update_recording(self, frame):
-        if not self.is_recording or not self.current_recording:
-            return
-            
-        # Write frame to video
-        self.current_recording.write(frame)
-        
-        # Check if 10 seconds have passed
-        if time.time() - self.recording_start_time >= self.recording_duration:
-            self.stop_recording()
+        self.recorder.write(frame)
 
-    #stop recording
+    #stop recording and queue the video for analysis
     def stop_recording(self):
-        if not self.is_recording:
-            return
-            
-        self.is_recording = False
-        if self.current_recording:
-            self.current_recording.release()
-            self.current_recording = None
-            
-            # Queue the video for analysis
-            self.analysis_queue.put(self.temp_video_path)
+        self.recorder.stop()
 
     #gemini ai to analyze
     def analyze_video_with_gemini(self, video_path):
+        """Blocking wrapper, the analysis queue uses analyze_video_with_gemini_async directly"""
+        gemini_service.run(self.analyze_video_with_gemini_async(video_path))
+
+    async def analyze_video_with_gemini_async(self, video_path):
         if not self.gemini_model:
             print("⚠️ Gemini not available for analysis")
             return
-            
-        try:
-            # Upload video to Gemini
-            video_file = genai.upload_file(path=video_path)
-            # Wait for video to be processed
-            while video_file.state.name == "PROCESSING":
-                time.sleep(2)
-                video_file = genai.get_file(video_file.name)
-                
-            if video_file.state.name == "FAILED":
-                print("✗ Video processing failed")
-                return
-                
-            # Create prompt for crime detection
-            prompt = """
+
+        # Create prompt for crime detection
+        prompt = """
             Analyze this video clip carefully and determine if any criminal or suspicious activities are taking place. 
             
             Respond with:
@@ -182,11 +146,24 @@ class YOLODetection:
             If the alert level is MEDIUM or higher, add 🚨 at the start and end of line 1 
 
             """
-            
-            # Generate analysis
-            response = self.gemini_model.generate_content([video_file, prompt])
-            response_text = response.text.strip()
-            
+
+        try:
+            service = gemini_service.get_service()
+            keyframes = []
+            if self.clip_input == 'keyframes':
+                keyframes = await asyncio.to_thread(extract_keyframes, video_path)
+            # Live clips go ahead of queued offline analyses
+            with request_priority(LIVE):
+                if keyframes:
+                    # Inline frames: no upload and no processing wait
+                    response_text = await service.analyze_keyframes(
+                        keyframes, prompt, self.gemini_model_name, prompt_first=False)
+                else:
+                    # Upload, wait for processing, generate and delete the uploaded file
+                    response_text = await service.analyze_video(
+                        video_path, prompt, self.gemini_model_name, prompt_first=False)
+            response_text = response_text.strip()
+
             if response_text and len(response_text) > 1:
                 print(f"\n{'='*50}")
                 print(f"WATCHTOWER ANALYSIS REPORT")
@@ -194,10 +171,9 @@ class YOLODetection:
                 print(f"{'='*50}")
                 print(response_text)
                 print(f"{'='*50}\n")
-            
-            # Clean up the uploaded file
-            genai.delete_file(video_file.name)
-            
+
+        except gemini_service.FileProcessingError:
+            print("✗ Video processing failed")
         except Exception as e:
             print(f"✗ Error analyzing video with Gemini: {e}")
         finally:
@@ -208,22 +184,26 @@ class YOLODetection:
                 pass
 
     def process_analysis_queue(self):
-        """Process videos in the analysis queue (runs in separate thread)"""
+        """Hand clips from the analysis queue to the Gemini event loop (runs in separate thread)"""
         while True:
             try:
                 video_path = self.analysis_queue.get(timeout=1)
-                self.analyze_video_with_gemini(video_path)
-                self.analysis_queue.task_done()
+                # Many clips can be in flight at once, task_done fires when each one finishes
+                future = gemini_service.submit(self.analyze_video_with_gemini_async(video_path))
+                future.add_done_callback(lambda _: self.analysis_queue.task_done())
             except queue.Empty:
                 continue
             except Exception as e:
                 print(f"Error in analysis thread: {e}")
 
     #draw a box around detection
-    def draw_detections(self, frame, boxes, confidences):
+    def draw_detections(self, frame, boxes, confidences, track_ids=None, recorder=None):
         result_frame = frame.copy()
+        recorder = recorder or self.recorder
+        if track_ids is None:
+            track_ids = [None] * len(boxes)
 
-        for box, confidence in zip(boxes, confidences):
+        for box, confidence, track_id in zip(boxes, confidences, track_ids):
             x, y, w, h = box
 
             #high confidence (green)
@@ -234,22 +214,24 @@ class YOLODetection:
             else: 
                 color = (0, 165, 255)
             
-            label = f'Human: {confidence:.2f}' 
+            label = f'Human: {confidence:.2f}' if track_id is None else f'Human #{track_id}: {confidence:.2f}' 
             #draw the box
             cv2.rectangle(result_frame, (x, y), (x + w, y + h), color, 2)
             cv2.putText(result_frame, label, (x, y-5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,0,0), 2)
         
         # Add recording indicator
-        if self.is_recording:
-            recording_time = time.time() - self.recording_start_time
-            remaining_time = max(0, self.recording_duration - recording_time)
+        if recorder.is_recording:
+            remaining_time = recorder.remaining()
             cv2.circle(result_frame, (30, 60), 10, (0, 0, 255), -1)  # Red circle
             cv2.putText(result_frame, f'REC {remaining_time:.1f}s', (50, 65), 
                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
         
         return result_frame
 
-    def run_detection(self, source=0, save_video=False):
+    # YOLO runs every Nth frame, N between min_stride and max_stride (max_stride=1 runs it on every frame)
+    # frames in between are covered by the tracker's predictions
+    # keyframes where less than motion_threshold of the scene changed skip YOLO too (None disables the gate)
+    def run_detection(self, source=0, save_video=False, min_stride=1, max_stride=6, motion_threshold=0.005):
         cap = cv2.VideoCapture(source)
 
         if not cap.isOpened():
@@ -274,6 +256,11 @@ class YOLODetection:
         last_detection_time = 0
         detection_cooldown = 2 # Wait 15 seconds before starting new recording after previous one ends
 
+        # Adaptive detection stride
+        stride = AdaptiveStride(min_stride, max_stride)
+        tracker = SortTracker()
+        motion_gate = MotionGate(threshold=motion_threshold) if motion_threshold else None
+
         try:
             print("🎯 Starting human detection with crime analysis...")
             print("Press 'q' to quit")
@@ -284,12 +271,21 @@ class YOLODetection:
                     print("End of video or failed to read frame")
                     break
 
-                # Detect humans
-                boxes, confidences = self.detect_humans(frame)
+                # Detect humans on keyframes, track them through the frames in between
+                if stride.should_detect():
+                    if motion_gate is None or motion_gate.should_infer(frame):
+                        boxes, confidences = self.detect_humans(frame)
+                        stride.update(len(boxes))
+                        tracks = tracker.update(boxes, confidences)
+                    else:
+                        # Nothing moved since YOLO last ran: coast the tracks, so people who left expire
+                        tracks = tracker.step()
+                else:
+                    tracks = tracker.step()
                 
-                # If humans detected and not currently recording and cooldown has passed
+                # If people are tracked and not currently recording and cooldown has passed
                 current_time = time.time()
-                if (len(boxes) > 0 and 
+                if (len(tracks) > 0 and 
                     not self.is_recording and 
                     current_time - last_detection_time > detection_cooldown):
                     
@@ -300,14 +296,16 @@ class YOLODetection:
                 if self.is_recording:
                     self.update_recording(frame)
                 
-                # Draw detections
-                result_frame = self.draw_detections(frame, boxes, confidences)
+                # Draw tracked people
+                result_frame = self.draw_detections(frame, [t.box for t in tracks],
+                                                    [t.confidence for t in tracks],
+                                                    [t.id for t in tracks])
 
                 # Calculate and display FPS
                 curr_time = time.time()
                 fps_current = 1 / (curr_time - prev_time)
                 prev_time = curr_time
-                cv2.putText(result_frame, f'FPS: {fps_current:.1f}', (10, 30),
+                cv2.putText(result_frame, f'FPS: {fps_current:.1f}  Stride: {stride.stride}', (10, 30),
                             cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
                 
                 # Add status info
@@ -334,6 +332,8 @@ class YOLODetection:
                 self.stop_recording()
                 
             cap.release()
+            if motion_gate is not None:
+                print(f"Motion gate: {motion_gate.stats()}")
             if save_video:
                 out.release()
                 print(f"Output video saved to: {output_filename}")
@@ -342,3 +342,76 @@ class YOLODetection:
             # Wait for any remaining analysis to complete
             print("Waiting for analysis to complete...")
             self.analysis_queue.join()
+
+    # Same as run_detection, but capture, inference and display/recording run on separate
+    # threads (see live_pipeline.LivePipeline), so slow inference never backs up the camera
+    def run_pipelined_detection(self, source=0, save_video=False, min_stride=1, max_stride=6,
+                                motion_threshold=0.005):
+        pipeline = LivePipeline(self, source, min_stride, max_stride, motion_threshold)
+        if not pipeline.is_opened():
+            print(f"Error: Could not open video source {source}")
+            return
+
+        width, height, fps = pipeline.width, pipeline.height, pipeline.fps
+        if save_video:
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            output_filename = f"output_{int(time.time())}.mp4"
+            out = cv2.VideoWriter(output_filename, fourcc, fps, (width, height))
+
+        prev_time = time.time()
+        last_detection_time = 0
+        detection_cooldown = 2
+
+        pipeline.start()
+        try:
+            print("🎯 Starting pipelined human detection with crime analysis...")
+            print("Press 'q' to quit")
+
+            for frame, tracks in pipeline.frames():
+                current_time = time.time()
+                if (len(tracks) > 0 and
+                    not self.is_recording and
+                    current_time - last_detection_time > detection_cooldown):
+
+                    self.open_recording(fps, width, height)
+                    last_detection_time = current_time
+
+                # every captured frame reaches this stage, so recordings keep the source frame rate
+                if self.is_recording:
+                    self.update_recording(frame)
+
+                result_frame = self.draw_detections(frame, [box for _, box, _ in tracks],
+                                                    [conf for _, _, conf in tracks],
+                                                    [track_id for track_id, _, _ in tracks])
+
+                fps_current = 1 / max(current_time - prev_time, 1e-6)
+                prev_time = current_time
+                latency = pipeline.timers['latency'].last * 1000
+                cv2.putText(result_frame, f'FPS: {fps_current:.1f}  Latency: {latency:.0f}ms  Stride: {pipeline.stride.stride}',
+                            (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+
+                status_color = (0, 255, 0) if self.gemini_model else (0, 0, 255)
+                gemini_status = "ONLINE" if self.gemini_model else "OFFLINE"
+                cv2.putText(result_frame, f'Gemini: {gemini_status}', (10, height-20),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, status_color, 2)
+
+                cv2.imshow("YOLO Human Detection + Crime Analysis", result_frame)
+                if save_video:
+                    out.write(result_frame)
+
+                key = cv2.waitKey(1) & 0xFF
+                if key == ord('q'):
+                    break
+
+        finally:
+            pipeline.stop()
+            if self.is_recording:
+                self.stop_recording()
+            if save_video:
+                out.release()
+                print(f"Output video saved to: {output_filename}")
+            cv2.destroyAllWindows()
+            print(f"Pipeline timings: {pipeline.report()}")
+
+            print("Waiting for analysis to complete...")
+            self.analysis_queue.join()
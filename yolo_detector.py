@@ -1,92 +1,59 @@
-import cv2
-import numpy as np
-import urllib.request
-import os
-import time
+from model_registry import get_model, resolve_input_size
+from yolo_postprocess import YOLOPostprocessor
 
 class YOLODetection:
     """
-    A class to handle YOLOv4 object detection, specifically for detecting humans.
-    It automatically downloads the required model files if they are not present.
+    A class to handle YOLO object detection, specifically for detecting humans.
+    The network is shared process-wide through model_registry and loaded on first use,
+    downloading the model files if they are not present.
     """
     # constructor, default values set
-    def __init__(self, confidence_threshold=0.5, nms_threshold=0.4):
+    def __init__(self, confidence_threshold=0.5, nms_threshold=0.4, model_name=None, input_size=None):
         self.confidence_threshold = confidence_threshold
         self.nms_threshold = nms_threshold
-        self.yolo_setup()
-
-    def yolo_setup(self):
-        """Downloads YOLOv4 model files and loads the network."""
-        files = {
-            'yolov4.weights': 'https://github.com/AlexeyAB/darknet/releases/download/darknet_yolo_v3_optimal/yolov4.weights',
-            'yolov4.cfg': 'https://raw.githubusercontent.com/AlexeyAB/darknet/master/cfg/yolov4.cfg',
-            'coco.names': 'https://raw.githubusercontent.com/AlexeyAB/darknet/master/data/coco.names'
-        }
-
-        print("Checking for YOLO model files...")
-        for filename, url in files.items():
-            if not os.path.exists(filename):
-                print(f"Downloading {filename}...")
-                try:
-                    urllib.request.urlretrieve(url, filename)
-                    print(f"✓ Downloaded {filename} successfully.")
-                except Exception as e:
-                    print(f"✗ Error downloading {filename}: {e}")
-                    # Exit or handle error appropriately if a file is critical
-                    return
-        
-        # Load class names
-        try:
-            with open('coco.names', 'r') as f:
-                self.classes = [line.strip() for line in f.readlines()]
-        except Exception as e:
-            print(f"✗ Error loading coco.names: {e}")
-            return
-
-        # Load YOLO network
-        try:
-            self.net = cv2.dnn.readNet('yolov4.weights', 'yolov4.cfg')
-            layer_names = self.net.getLayerNames()
-            # Note: The way to get output layers can vary between OpenCV versions
-            self.output_layers = [layer_names[i - 1] for i in self.net.getUnconnectedOutLayers()]
-            print("✓ YOLO model loaded successfully.")
-        except Exception as e:
-            print(f"✗ Error loading YOLO model: {e}")
+        self.yolo_setup(model_name, input_size)
+
+    def yolo_setup(self, model_name=None, input_size=None):
+        """
+        Attaches a shared network from the model catalogue (YOLO_MODEL by default).
+        Model files are downloaded and loaded on first use.
+        """
+        self.model = get_model(model_name)
+        self.input_size = resolve_input_size(self.model.name, input_size)
+        self.postprocessor = YOLOPostprocessor(input_size=self.input_size)
+
+    def load_model(self):
+        """Makes sure the shared network is loaded and returns it."""
+        model = self.model.load()
+        self.postprocessor.class_id = model.person_class_id
+        return model
 
     def detect_humans(self, frame):
         """Detects humans in an OpenCV frame using YOLO."""
-        height, width = frame.shape[:2]
-        blob = cv2.dnn.blobFromImage(frame, 1/255.0, (416, 416), swapRB=True, crop=False)
-        self.net.setInput(blob)
-        outputs = self.net.forward(self.output_layers)
-
-        boxes, confidences, class_ids = [], [], []
-
-        for output in outputs:
-            for detection in output:
-                scores = detection[5:]
-                class_id = np.argmax(scores)
-                confidence = scores[class_id]
-                
-                # Check if the detected object is a 'person' and meets the confidence threshold
-                if self.classes[class_id] == "person" and confidence > self.confidence_threshold:
-                    center_x = int(detection[0] * width)
-                    center_y = int(detection[1] * height)
-                    w = int(detection[2] * width)
-                    h = int(detection[3] * height)
-                    x = int(center_x - w / 2)
-                    y = int(center_y - h / 2)
-                    
-                    boxes.append([x, y, w, h])
-                    confidences.append(float(confidence))
-                    class_ids.append(class_id)
-
-        # Apply Non-Max Suppression to eliminate redundant overlapping boxes
-        indices = cv2.dnn.NMSBoxes(boxes, confidences, self.confidence_threshold, self.nms_threshold)
-        
-        final_boxes = []
-        if len(indices) > 0:
-            for i in indices.flatten():
-                final_boxes.append(boxes[i])
-        
+        final_boxes, _ = self.detect_humans_with_confidences(frame)
         return final_boxes
+
+    def detect_humans_with_confidences(self, frame):
+        """Like detect_humans, but returns (boxes, confidences)."""
+        height, width = frame.shape[:2]
+        model = self.load_model()
+        with model.lock:
+            outputs = self.postprocessor.forward(model.net, model.output_layers, [frame])
+
+            # Decode person boxes and apply Non-Max Suppression to eliminate redundant overlapping boxes
+            return self.postprocessor.detect(outputs, width, height,
+                                             self.confidence_threshold, self.nms_threshold)
+
+    def detect_humans_batch(self, frames):
+        """Detects humans in several frames with a single forward pass. Returns one box list per frame."""
+        return [boxes for boxes, _ in self.detect_humans_batch_with_confidences(frames)]
+
+    def detect_humans_batch_with_confidences(self, frames, sizes=None):
+        """
+        Like detect_humans_batch, but returns one (boxes, confidences) pair per frame.
+        sizes: original (width, height) per frame when the frames were resized beforehand.
+        """
+        model = self.load_model()
+        with model.lock:
+            return self.postprocessor.detect_batch(model.net, model.output_layers, frames,
+                                                   self.confidence_threshold, self.nms_threshold, sizes=sizes)
@@ -0,0 +1,130 @@
+import cv2
+import numpy as np
+
+
+class YOLOPostprocessor:
+    """
+    Shared NumPy post-processing for the YOLO detectors.
+    Keeps the input blob and the network output buffers allocated between
+    calls so a steady stream of frames does not reallocate them every time.
+    """
+    def __init__(self, input_size=416, class_id=0):
+        self.input_size = input_size
+        self.class_id = class_id
+        self.blob = None
+        self.outputs = None
+        self._resized = None
+
+    def make_blob(self, frames):
+        """
+        Fills the preallocated NCHW blob with the given frames.
+        Produces the same tensor as cv2.dnn.blobFromImages(frames, 1/255.0,
+        (size, size), swapRB=True, crop=False).
+        """
+        size = self.input_size
+        if self.blob is None or self.blob.shape != (len(frames), 3, size, size):
+            self.blob = np.empty((len(frames), 3, size, size), dtype=np.float32)
+        if self._resized is None or self._resized.shape[0] != size:
+            self._resized = np.empty((size, size, 3), dtype=np.uint8)
+
+        for i, frame in enumerate(frames):
+            cv2.resize(frame, (size, size), dst=self._resized)
+            # Write the channels in RGB order, scaled to [0, 1]
+            for c in range(3):
+                np.multiply(self._resized[:, :, 2 - c], 1 / 255.0,
+                            out=self.blob[i, c], casting='unsafe')
+        return self.blob
+
+    def forward(self, net, output_layers, frames):
+        """Runs the network on the frames, reusing the previous output buffers."""
+        net.setInput(self.make_blob(frames))
+        if self.outputs is None:
+            self.outputs = list(net.forward(output_layers))
+        else:
+            # forward() writes into the buffers in place when the shapes match
+            self.outputs = list(net.forward(output_layers, self.outputs))
+        return self.outputs
+
+    @staticmethod
+    def split_batch(outputs, batch_size):
+        """Splits batched network outputs into one list of outputs per frame."""
+        if batch_size == 1:
+            return [[output.reshape(-1, output.shape[-1]) for output in outputs]]
+        per_frame = [output.reshape(batch_size, -1, output.shape[-1]) for output in outputs]
+        return [[output[i] for output in per_frame] for i in range(batch_size)]
+
+    def decode(self, outputs, width, height, confidence_threshold, clip=False):
+        """
+        Turns raw YOLO output rows into [x, y, w, h] boxes for the target class.
+        Matches the old per-row loop: a row is kept when the class has the
+        highest score and that score is above the threshold.
+        With clip=True boxes are clamped to the frame like yolo_detection did.
+        """
+        all_boxes, all_confidences = [], []
+
+        for output in outputs:
+            rows = output.reshape(-1, output.shape[-1])
+            # Cheap pre-filter on the class column, then confirm it is the argmax
+            candidates = np.flatnonzero(rows[:, 5 + self.class_id] > confidence_threshold)
+            if len(candidates) == 0:
+                continue
+            rows = rows[candidates]
+            rows = rows[rows[:, 5:].argmax(axis=1) == self.class_id]
+            if len(rows) == 0:
+                continue
+
+            cx = (rows[:, 0] * width).astype(np.int64)
+            cy = (rows[:, 1] * height).astype(np.int64)
+            w = (rows[:, 2] * width).astype(np.int64)
+            h = (rows[:, 3] * height).astype(np.int64)
+
+            if clip:
+                x = np.maximum(0, cx - w // 2)
+                y = np.maximum(0, cy - h // 2)
+                w = np.minimum(w, width - x)
+                h = np.minimum(h, height - y)
+            else:
+                x = (cx - w / 2).astype(np.int64)
+                y = (cy - h / 2).astype(np.int64)
+
+            all_boxes.append(np.stack([x, y, w, h], axis=1))
+            all_confidences.append(rows[:, 5 + self.class_id])
+
+        if not all_boxes:
+            return np.empty((0, 4), dtype=np.int64), np.empty(0, dtype=np.float32)
+        return np.concatenate(all_boxes), np.concatenate(all_confidences)
+
+    def detect(self, outputs, width, height, confidence_threshold, nms_threshold, clip=False):
+        """Decodes the outputs and applies Non-Max Suppression."""
+        boxes, confidences = self.decode(outputs, width, height, confidence_threshold, clip)
+        if len(boxes) == 0:
+            return [], []
+
+        boxes = boxes.tolist()
+        confidences = confidences.tolist()
+        indices = cv2.dnn.NMSBoxes(boxes, confidences, confidence_threshold, nms_threshold)
+        if len(indices) == 0:
+            return [], []
+
+        indices = np.array(indices).flatten()
+        return [boxes[i] for i in indices], [confidences[i] for i in indices]
+
+    def detect_batch(self, net, output_layers, frames, confidence_threshold, nms_threshold, clip=False,
+                     sizes=None):
+        """
+        Runs all frames through the network in one forward pass.
+        Frames may come from different sources and have different sizes.
+        sizes gives the (width, height) to report boxes in, for frames that were
+        already resized (e.g. to the input size) before being handed over.
+        Returns one (boxes, confidences) pair per frame.
+        """
+        if len(frames) == 0:
+            return []
+
+        outputs = self.forward(net, output_layers, frames)
+        sizes = sizes or [frame.shape[1::-1] for frame in frames]
+        results = []
+        for (width, height), frame_outputs in zip(sizes, self.split_batch(outputs, len(frames))):
+            results.append(self.detect(frame_outputs, width, height,
+                                       confidence_threshold, nms_threshold, clip))
+        return results